@@ -1,74 +1,173 @@
-from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, File, UploadFile, Form, BackgroundTasks, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse, ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.middleware.gzip import GZipMiddleware
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 import os
 import logging
 import base64
 import io
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional, Dict, Any, Final, Mapping, Tuple
+from types import MappingProxyType
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import numpy as np
 import cv2
-from PIL import Image
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
 import pickle
-import requests
-from geopy.geocoders import Nominatim
+import sklearn
 from geopy.distance import geodesic
 import googletrans
 from langdetect import detect
 from emergentintegrations.llm.chat import LlmChat, UserMessage
-import requests_cache
 import json
+import orjson
 import asyncio
+from functools import lru_cache
+import httpx
+from cachetools import TTLCache
+from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+from slowapi.util import get_remote_address
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+import hashlib
+import random
+import threading
+import time
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# Setup caching for API requests
-requests_cache.install_cache('agriculture_cache', expire_after=3600)
-
-# MongoDB connection
+# MongoDB connection - a bounded pool; requests wait at most 1s for a free connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '50')),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '5')),
+    waitQueueTimeoutMS=1000,
+    compressors="zstd,snappy,zlib",
+    retryWrites=True,
+    serverSelectionTimeoutMS=2000
+)
 db = client[os.environ['DB_NAME']]
 
-# Create the main app without a prefix
-app = FastAPI()
+# Uploaded plant images live in GridFS; documents only keep the file id
+image_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="disease_images")
+
+# Largest plant image accepted by /disease/detect
+MAX_UPLOAD = 8 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1 << 16
+
+# Chat messages older than this are removed by a TTL index
+CHAT_HISTORY_TTL_DAYS = int(os.environ.get('CHAT_HISTORY_TTL_DAYS', '30'))
+
+# Stored prices change at most a few times an hour; cleared whenever new prices are written
+_market_prices_cache = TTLCache(maxsize=1024, ttl=300)
+
+# Compound indexes created at startup; each matches a hot read's filter and sort, so the planner picks it without a hint
+CHAT_BY_SESSION_INDEX = [("session_id", 1), ("timestamp", 1)]
+MARKET_PRICES_BY_CROP_INDEX = [("crop_name", 1), ("timestamp", -1)]
+MARKET_PRICES_BY_TIME_INDEX = [("timestamp", -1)]
+# One stored price per quote; bulk uploads upsert on these fields
+MARKET_PRICES_QUOTE_INDEX = [("crop_name", 1), ("market_name", 1), ("timestamp", 1)]
+
+# Prefer uvloop for any event loop created after import (other ASGI servers, scripts);
+# uvicorn sets up its own loop first and picks uvloop itself
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
+# Create the main app without a prefix.
+# Run with: uvicorn server:app --loop uvloop --http httptools --workers $(nproc)
+# or in production: gunicorn server:app -k uvicorn.workers.UvicornWorker --workers $(nproc)
+# (uvicorn's default "auto" loop/http settings also pick uvloop and httptools when installed).
+# Behind a reverse proxy add --proxy-headers --forwarded-allow-ips=<proxy address> (gunicorn:
+# FORWARDED_ALLOW_IPS=<proxy address>) so request.client is the farmer's address, not the proxy's.
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Per-client rate limit for the endpoints that call the LLM, keyed on request.client (see the proxy note above).
+# The default in-memory store counts per worker; point RATE_LIMIT_STORAGE_URI at a shared store
+# (e.g. redis://host:6379) to enforce one limit across workers.
+LLM_RATE_LIMIT = os.environ.get('LLM_RATE_LIMIT', '10/minute')
+limiter = Limiter(key_func=get_remote_address, storage_uri=os.environ.get('RATE_LIMIT_STORAGE_URI', 'memory://'))
+app.state.limiter = limiter
+app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # Initialize translator
 translator = googletrans.Translator()
-geolocator = Nominatim(user_agent="digifarmer")
+
+# Shared async HTTP client - keep-alive connections are reused across requests
+http_client = httpx.AsyncClient(
+    timeout=10,
+    headers={'User-Agent': 'digifarmer'},
+    limits=httpx.Limits(max_keepalive_connections=32)
+)
+NOMINATIM_REVERSE_URL = 'https://nominatim.openstreetmap.org/reverse'
+
+# Fast ID generation
+_uuid_local = threading.local()
+
+def _reset_uuid_rng():
+    global _uuid_local
+    _uuid_local = threading.local()
+
+# Forked workers must not share PRNG state with the parent
+os.register_at_fork(after_in_child=_reset_uuid_rng)
+
+def fast_uuid() -> str:
+    """Time-ordered UUIDv7 from a per-thread PRNG seeded once from os.urandom"""
+    rng = getattr(_uuid_local, 'rng', None)
+    if rng is None:
+        rng = _uuid_local.rng = random.Random(os.urandom(16))
+    value = (time.time_ns() // 1_000_000) << 80 | rng.getrandbits(80)
+    value = (value & ~(0xF << 76)) | (0x7 << 76)  # version 7
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)  # RFC 4122 variant
+    return str(uuid.UUID(int=value))
+
+def _utcnow() -> datetime:
+    """Timezone-aware replacement for the deprecated datetime.utcnow"""
+    return datetime.now(timezone.utc)
 
 # Define Models
 class StatusCheck(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str = Field(default_factory=fast_uuid)
     client_name: str
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: datetime = Field(default_factory=_utcnow)
 
 class StatusCheckCreate(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
     client_name: str
 
 class ChatMessage(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str = Field(default_factory=fast_uuid)
     session_id: str
     message: str
     response: str
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: datetime = Field(default_factory=_utcnow)
     message_type: str = "text"  # text, image, voice
     language: str = "en"
     location: Optional[Dict[str, Any]] = None
 
 class ChatRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
     message: str
     session_id: Optional[str] = None
     message_type: str = "text"
@@ -77,6 +176,8 @@ class ChatRequest(BaseModel):
     image_data: Optional[str] = None
 
 class ChatResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
     response: str
     session_id: str
     message_id: str
@@ -84,6 +185,8 @@ class ChatResponse(BaseModel):
     translated_response: Optional[str] = None
 
 class LocationData(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
     latitude: float
     longitude: float
     address: Optional[str] = None
@@ -91,7 +194,9 @@ class LocationData(BaseModel):
     country: Optional[str] = None
 
 class CropRecommendation(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str = Field(default_factory=fast_uuid)
     location: Dict[str, Any]
     soil_type: str
     ph_level: float
@@ -100,46 +205,119 @@ class CropRecommendation(BaseModel):
     rainfall: float
     recommended_crops: List[Dict[str, Any]]
     confidence_score: float
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: datetime = Field(default_factory=_utcnow)
     ml_prediction: Dict[str, Any]
 
+class CropRecoSchema(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
+    crops: List[str]
+    reasons: List[str] = []
+    season: str = ""
+
 class DiseaseDetection(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    image_data: str
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str = Field(default_factory=fast_uuid)
+    image_ref: str  # GridFS file id of the uploaded image
     detected_disease: str
     confidence_score: float
     treatment_recommendations: List[str]
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: datetime = Field(default_factory=_utcnow)
     crop_type: Optional[str] = None
 
 class MarketPrice(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str = Field(default_factory=fast_uuid)
     crop_name: str
     price_per_kg: float
     market_name: str
     location: Dict[str, Any]
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: datetime = Field(default_factory=_utcnow)
     source: str = "real_time_api"
 
+# Only the fields MarketPrice needs; skips _id and anything added by other writers
+MARKET_PRICE_PROJECTION = {
+    "_id": 0, "id": 1, "crop_name": 1, "price_per_kg": 1, "market_name": 1,
+    "location": 1, "timestamp": 1, "source": 1
+}
+
+# Price list rows by default - what a list view shows, without the nested location
+MARKET_PRICE_SUMMARY_PROJECTION = {"_id": 0, "crop_name": 1, "price_per_kg": 1, "market_name": 1, "timestamp": 1}
+
 class WeatherData(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
     location: Dict[str, Any]
     temperature: float
     humidity: float
     rainfall: float
     wind_speed: float
     conditions: str
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: datetime = Field(default_factory=_utcnow)
+
+# Query parameters of the legacy AI endpoints, validated before any LLM call (bad input gets a 422).
+# pattern=r"\S" rejects whitespace-only values, which min_length alone would let through.
+class ProfitRequest(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True)
+    
+    crop_name: str = Field(min_length=1, max_length=64, pattern=r"\S")
+    area_acres: float = Field(gt=0, le=100000)
+    location: str = Field(min_length=1, max_length=128, pattern=r"\S")
+
+class CropRecommendationRequest(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True)
+    
+    location: str = Field(min_length=1, max_length=128, pattern=r"\S")
+    soil_type: str = Field(min_length=1, max_length=64, pattern=r"\S")
+    ph_level: float = Field(ge=0, le=14)
+    moisture_level: str = Field(min_length=1, max_length=32, pattern=r"\S")
 
 # ML Models initialization
+# The crop model is deterministic (seeded), so it is trained once and reloaded by later workers
+CROP_MODEL_PATH = ROOT_DIR / 'crop_rf.pkl'
+
 class CropRecommendationML:
     def __init__(self):
         self.model = RandomForestClassifier(n_estimators=100, random_state=42)
         self.scaler = StandardScaler()
         self.crop_labels = ['Rice', 'Wheat', 'Cotton', 'Sugarcane', 'Maize', 'Soybean', 'Barley', 'Groundnut']
         self.is_trained = False
+        self._forest = None
         self._train_model()
+        # Fitted scaler parameters as tuples so predict_crops can scale one sample without sklearn overhead
+        self._mean = tuple(self.scaler.mean_.tolist())
+        self._scale = tuple(self.scaler.scale_.tolist())
+        self._compile_forest()
+    
+    def _load_model(self) -> bool:
+        try:
+            with open(CROP_MODEL_PATH, 'rb') as f:
+                saved = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return False
+        # Pickled estimators are only reliable with the sklearn version that fitted them
+        if not isinstance(saved, dict) or saved.get('sklearn_version') != sklearn.__version__:
+            return False
+        self.model, self.scaler = saved['model'], saved['scaler']
+        return True
+    
+    def _save_model(self):
+        # Write to a temporary file first so concurrent workers never read a partial pickle
+        tmp_path = CROP_MODEL_PATH.with_suffix(f'.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'model': self.model, 'scaler': self.scaler, 'sklearn_version': sklearn.__version__}, f)
+            os.replace(tmp_path, CROP_MODEL_PATH)
+        except OSError as e:
+            logging.warning("Could not save crop model: %s", e)
     
     def _train_model(self):
+        if self._load_model():
+            self.is_trained = True
+            return
+        
         # Mock training data - in production, use real agricultural datasets
         np.random.seed(42)
         n_samples = 1000
@@ -152,51 +330,82 @@ class CropRecommendationML:
         X[:, 3] = X[:, 3] * 300 + 200  # Rainfall: 200-500mm
         X[:, 4] = X[:, 4] * 3 + 1  # Soil organic matter: 1-4%
         
-        # Generate labels based on conditions
-        y = []
-        for features in X:
-            pH, temp, humidity, rainfall, organic = features
-            if pH < 6 and temp > 25 and rainfall > 300:
-                crop = 0  # Rice
-            elif pH > 6.5 and temp < 25 and rainfall < 300:
-                crop = 1  # Wheat
-            elif temp > 30 and rainfall > 400:
-                crop = 2  # Cotton
-            elif temp > 28 and rainfall > 350:
-                crop = 3  # Sugarcane
-            elif pH > 6 and temp > 20 and humidity > 60:
-                crop = 4  # Maize
-            elif pH > 6.5 and rainfall > 250:
-                crop = 5  # Soybean
-            elif temp < 20 and rainfall < 250:
-                crop = 6  # Barley
-            else:
-                crop = 7  # Groundnut
-            y.append(crop)
+        # Generate labels based on conditions - np.select picks the first matching rule per row
+        pH, temp, humidity, rainfall = X[:, 0], X[:, 1], X[:, 2], X[:, 3]
+        conditions = [
+            (pH < 6) & (temp > 25) & (rainfall > 300),  # Rice
+            (pH > 6.5) & (temp < 25) & (rainfall < 300),  # Wheat
+            (temp > 30) & (rainfall > 400),  # Cotton
+            (temp > 28) & (rainfall > 350),  # Sugarcane
+            (pH > 6) & (temp > 20) & (humidity > 60),  # Maize
+            (pH > 6.5) & (rainfall > 250),  # Soybean
+            (temp < 20) & (rainfall < 250)  # Barley
+        ]
+        y = np.select(conditions, range(len(conditions)), default=7)  # Groundnut
         
         X_scaled = self.scaler.fit_transform(X)
         self.model.fit(X_scaled, y)
         self.is_trained = True
+        self._save_model()
+    
+    def _compile_forest(self):
+        """Flatten all fitted trees into shared node arrays so one sample walks every tree at once"""
+        try:
+            trees = [estimator.tree_ for estimator in self.model.estimators_]
+            offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+            left = np.concatenate([np.where(t.children_left >= 0, t.children_left + o, -1) for t, o in zip(trees, offsets)])
+            right = np.concatenate([np.where(t.children_right >= 0, t.children_right + o, -1) for t, o in zip(trees, offsets)])
+            values = np.concatenate([t.value[:, 0, :] for t in trees])
+            self._forest = {
+                'roots': offsets,
+                'left': left,
+                'right': right,
+                'feature': np.concatenate([t.feature for t in trees]),
+                'threshold': np.concatenate([t.threshold for t in trees]),
+                'proba': values / values.sum(axis=1, keepdims=True),
+                'max_depth': max(t.max_depth for t in trees)
+            }
+        except (AttributeError, ValueError) as e:
+            logging.warning("Crop model compilation failed, using sklearn inference: %s", e)
+            self._forest = None
+    
+    def _predict_proba_compiled(self, features_scaled: np.ndarray) -> np.ndarray:
+        forest = self._forest
+        # sklearn compares float32 features against the split thresholds
+        x = features_scaled[0].astype(np.float32).astype(np.float64)
+        nodes = forest['roots'].copy()
+        for _ in range(forest['max_depth']):
+            left = forest['left'][nodes]
+            internal = left >= 0
+            if not internal.any():
+                break
+            go_left = x[np.maximum(forest['feature'][nodes], 0)] <= forest['threshold'][nodes]
+            nodes = np.where(internal, np.where(go_left, left, forest['right'][nodes]), nodes)
+        return forest['proba'][nodes].mean(axis=0)
     
     def predict_crops(self, ph, temperature, humidity, rainfall, organic_matter=2.5):
         if not self.is_trained:
             return []
         
-        features = np.array([[ph, temperature, humidity, rainfall, organic_matter]])
-        features_scaled = self.scaler.transform(features)
+        features = (ph, temperature, humidity, rainfall, organic_matter)
+        features_scaled = np.array([[(v - m) / s for v, m, s in zip(features, self._mean, self._scale)]])
         
         # Get probabilities for all crops
-        probabilities = self.model.predict_proba(features_scaled)[0]
+        if self._forest is not None:
+            probabilities = self._predict_proba_compiled(features_scaled)
+        else:
+            probabilities = self.model.predict_proba(features_scaled)[0]
         
-        # Get top 3 recommendations
-        top_indices = np.argsort(probabilities)[::-1][:3]
+        # Get top 3 recommendations - plain Python is cheaper than NumPy dispatch for 8 values
+        probabilities = probabilities.tolist()
+        top_indices = sorted(range(len(probabilities)), key=probabilities.__getitem__, reverse=True)[:3]
         
         recommendations = []
         for idx in top_indices:
             recommendations.append({
                 'crop': self.crop_labels[idx],
-                'confidence': float(probabilities[idx]),
-                'suitability_score': float(probabilities[idx] * 100)
+                'confidence': probabilities[idx],
+                'suitability_score': probabilities[idx] * 100
             })
         
         return recommendations
@@ -213,47 +422,69 @@ class DiseaseDetectionML:
             'mosaic_virus': {'treatment': ['Remove infected plants', 'Control insect vectors', 'Use virus-free seeds']},
             'bacterial_wilt': {'treatment': ['Improve soil drainage', 'Use resistant varieties', 'Copper-based bactericides']}
         }
+        # Results of recently analysed images, keyed by content hash, so re-uploads skip decoding
+        self._results = TTLCache(maxsize=256, ttl=3600)
     
     def detect_disease(self, image_data: str) -> Dict[str, Any]:
+        # Decode base64 image (optionally a data URL); undecodable input is reported as a failed analysis
+        try:
+            image_bytes = base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
+        except ValueError:
+            image_bytes = b''
+        return self.detect_disease_bytes(image_bytes)
+    
+    def detect_disease_bytes(self, image_bytes: bytes) -> Dict[str, Any]:
         # Mock detection based on image analysis
         # In production, use trained CNN models
+        image_hash = hashlib.sha1(image_bytes).digest()
+        cached = self._results.get(image_hash)
+        if cached is not None:
+            return cached
+        
+        result = self._analyse_image(image_bytes)
+        self._results[image_hash] = result
+        return result
+    
+    def _analyse_image(self, image_bytes: bytes) -> Dict[str, Any]:
         try:
-            # Decode base64 image
-            image_bytes = base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
-            image = Image.open(io.BytesIO(image_bytes))
+            # Decode straight into a contiguous BGR array
+            img_array = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img_array is None:
+                raise ValueError("Unsupported image data")
             
-            # Convert to numpy array for analysis
-            img_array = np.array(image)
+            # Colour statistics are practically unchanged on a thumbnail, so analyse at most 256x256 pixels
+            if img_array.shape[0] * img_array.shape[1] > 256 * 256:
+                img_array = cv2.resize(img_array, (256, 256), interpolation=cv2.INTER_AREA)
             
-            # Mock analysis based on color distribution
-            mean_color = np.mean(img_array, axis=(0, 1))
+            # Mock analysis based on color distribution - per-channel mean and std in one pass
+            channel_mean, channel_std = cv2.meanStdDev(img_array)
+            channel_mean, channel_std = channel_mean.ravel(), channel_std.ravel()
+            b, g, r = channel_mean
+            
+            # Standard deviation over all channels combined, from the per-channel moments
+            overall_mean = channel_mean.mean()
+            overall_std = np.sqrt(np.mean(channel_std ** 2 + channel_mean ** 2) - overall_mean ** 2)
             
             # Simple heuristic for disease detection
-            if len(mean_color) >= 3:
-                r, g, b = mean_color[:3]
-                
-                if g < 100:  # Low green suggests disease
-                    if r > g and r > b:
-                        disease = 'rust'
-                        confidence = 0.75
-                    elif b > r and b > g:
-                        disease = 'bacterial_wilt'
-                        confidence = 0.65
-                    else:
-                        disease = 'leaf_spot'
-                        confidence = 0.70
-                elif r > 150 and g > 150:  # Yellowish
-                    disease = 'mosaic_virus'
-                    confidence = 0.60
-                elif np.std(img_array) < 30:  # Low variation suggests blight
-                    disease = 'blight'
-                    confidence = 0.55
+            if g < 100:  # Low green suggests disease
+                if r > g and r > b:
+                    disease = 'rust'
+                    confidence = 0.75
+                elif b > r and b > g:
+                    disease = 'bacterial_wilt'
+                    confidence = 0.65
                 else:
-                    disease = 'healthy'
-                    confidence = 0.85
+                    disease = 'leaf_spot'
+                    confidence = 0.70
+            elif r > 150 and g > 150:  # Yellowish
+                disease = 'mosaic_virus'
+                confidence = 0.60
+            elif overall_std < 30:  # Low variation suggests blight
+                disease = 'blight'
+                confidence = 0.55
             else:
                 disease = 'healthy'
-                confidence = 0.50
+                confidence = 0.85
             
             return {
                 'disease': disease,
@@ -273,16 +504,68 @@ crop_ml = CropRecommendationML()
 disease_ml = DiseaseDetectionML()
 
 # Helper functions
+# Background tasks are referenced here until they finish so they are not garbage collected
+_background_tasks = set()
+
+def _log_background_result(task: asyncio.Task, label: str):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error("%s error: %s", label, task.exception())
+
+def schedule_background(coro, label: str) -> asyncio.Task:
+    """Run a coroutine without awaiting it, logging any failure"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(lambda t: _log_background_result(t, label))
+    return task
+
+async def insert_document(collection, document: Dict[str, Any], label: str):
+    """Insert a document, logging failures instead of passing them on to the caller"""
+    try:
+        await collection.insert_one(document)
+    except Exception as e:
+        logging.error("%s persist error: %s", label, e)
+
+async def store_disease_detection(image_id: ObjectId, filename: str, image_data: bytes, detection: Dict[str, Any]):
+    """Upload the image to GridFS, then record the detection that references it"""
+    try:
+        await image_bucket.upload_from_stream_with_id(image_id, filename, image_data)
+    except Exception as e:
+        logging.error("Disease image upload error: %s", e)
+        return
+    await insert_document(db.disease_detections, detection, "Disease detection")
+
+async def bulk_upsert_prices(docs: List[Dict[str, Any]]):
+    """Write a batch of market prices in one round trip; re-sending the same quote updates it instead of duplicating it"""
+    # Unordered so one bad document doesn't abort the rest of the batch.
+    # A re-sent quote keeps the id it was first stored with.
+    result = await db.market_prices.bulk_write(
+        [
+            UpdateOne(
+                {"crop_name": d["crop_name"], "market_name": d["market_name"], "timestamp": d["timestamp"]},
+                {
+                    "$set": {k: v for k, v in d.items() if k != "id"},
+                    "$setOnInsert": {"id": d["id"]}
+                },
+                upsert=True
+            )
+            for d in docs
+        ],
+        ordered=False
+    )
+    _market_prices_cache.clear()
+    return result
+
 async def get_weather_data(latitude: float, longitude: float) -> Dict[str, Any]:
     """Get real-time weather data"""
     try:
         # Mock weather API - in production use OpenWeatherMap, WeatherAPI, etc.
         return {
-            'temperature': 25.0 + np.random.uniform(-5, 10),
-            'humidity': 60.0 + np.random.uniform(-20, 20),
-            'rainfall': np.random.uniform(0, 50),
-            'wind_speed': np.random.uniform(5, 25),
-            'conditions': np.random.choice(['sunny', 'cloudy', 'rainy', 'partly_cloudy'])
+            'temperature': 25.0 + random.uniform(-5, 10),
+            'humidity': 60.0 + random.uniform(-20, 20),
+            'rainfall': random.uniform(0, 50),
+            'wind_speed': random.uniform(5, 25),
+            'conditions': random.choice(['sunny', 'cloudy', 'rainy', 'partly_cloudy'])
         }
     except Exception:
         return {
@@ -307,7 +590,7 @@ async def get_market_prices_realtime(location: Dict[str, Any], crop: str = None)
             }.get(crop_name, 20.0)
             
             # Add regional variation
-            regional_factor = np.random.uniform(0.8, 1.3)
+            regional_factor = random.uniform(0.8, 1.3)
             current_price = base_price * regional_factor
             
             prices.append({
@@ -315,7 +598,7 @@ async def get_market_prices_realtime(location: Dict[str, Any], crop: str = None)
                 'price_per_kg': round(current_price, 2),
                 'market_name': f"{location.get('region', 'Local')} Mandi",
                 'location': location,
-                'timestamp': datetime.utcnow().isoformat(),
+                'timestamp': _utcnow(),
                 'source': 'real_time_api'
             })
         
@@ -323,6 +606,7 @@ async def get_market_prices_realtime(location: Dict[str, Any], crop: str = None)
     except Exception:
         return []
 
+@lru_cache(maxsize=4096)
 def detect_language(text: str) -> str:
     """Detect language of input text"""
     try:
@@ -330,35 +614,58 @@ def detect_language(text: str) -> str:
     except:
         return 'en'
 
-def translate_text(text: str, target_language: str, source_language: str = 'auto') -> str:
+# Translations of identical text are reused instead of calling the translate service again
+_translation_cache = TTLCache(maxsize=4096, ttl=86400)
+
+async def translate_text(text: str, target_language: str, source_language: str = 'auto') -> str:
     """Translate text to target language"""
     try:
         if source_language == target_language or target_language == 'en':
             return text
-        result = translator.translate(text, src=source_language, dest=target_language)
+        cache_key = (hashlib.sha256(text.encode('utf-8')).hexdigest(), source_language, target_language)
+        cached = _translation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        # googletrans 4.x is async - awaiting it keeps the event loop free during the HTTP call
+        result = await translator.translate(text, src=source_language, dest=target_language)
+        _translation_cache[cache_key] = result.text
         return result.text
     except Exception as e:
-        logging.error(f"Translation error: {str(e)}")
+        logging.error("Translation error: %s", e)
         return text
 
-def get_location_info(latitude: float, longitude: float) -> Dict[str, Any]:
+# Reverse-geocoding results keyed on ~100m precision; Nominatim is rate limited and addresses rarely change
+_geo_cache = TTLCache(maxsize=10_000, ttl=86400)
+
+async def get_location_info(latitude: float, longitude: float) -> Dict[str, Any]:
     """Get location information from coordinates"""
+    cache_key = (round(latitude, 3), round(longitude, 3))
+    cached = _geo_cache.get(cache_key)
+    if cached is not None:
+        return {**cached, 'latitude': latitude, 'longitude': longitude}
+    
     try:
-        location = geolocator.reverse((latitude, longitude), timeout=10)
-        if location:
-            address = location.address
-            components = location.raw.get('address', {})
-            return {
+        response = await http_client.get(
+            NOMINATIM_REVERSE_URL,
+            params={'lat': latitude, 'lon': longitude, 'format': 'json'}
+        )
+        response.raise_for_status()
+        location = response.json()
+        if location.get('display_name'):
+            components = location.get('address', {})
+            location_info = {
                 'latitude': latitude,
                 'longitude': longitude,
-                'address': address,
+                'address': location['display_name'],
                 'region': components.get('state', ''),
                 'country': components.get('country', ''),
                 'district': components.get('county', ''),
                 'city': components.get('city', components.get('town', components.get('village', '')))
             }
+            _geo_cache[cache_key] = location_info
+            return {**location_info}
     except Exception as e:
-        logging.error(f"Geocoding error: {str(e)}")
+        logging.error("Geocoding error: %s", e)
     
     return {
         'latitude': latitude,
@@ -368,58 +675,445 @@ def get_location_info(latitude: float, longitude: float) -> Dict[str, Any]:
         'country': 'Unknown'
     }
 
-# Initialize LLM Chat with multi-language support
-def get_llm_chat(session_id: str, language: str = 'en'):
-    language_prompts = {
-        'en': "You are DigiFarmer, an expert agricultural advisor AI assistant specifically designed for farmers worldwide. You provide personalized advice on crops, diseases, market prices, and sustainable farming practices.",
-        'hi': "आप DigiFarmer हैं, एक विशेषज्ञ कृषि सलाहकार AI सहायक जो विशेष रूप से दुनिया भर के किसानों के लिए डिज़ाइन किया गया है। आप फसलों, बीमारियों, बाजार की कीमतों और टिकाऊ कृषि प्रथाओं पर व्यक्तिगत सलाह प्रदान करते हैं।",
-        'te': "మీరు DigiFarmer, ప్రపంచవ్యాప్తంగా రైతుల కోసం ప్రత్యేకంగా రూపొందించబడిన నిపుణ వ్యవసాయ సలహాదారు AI సహాయకుడు. మీరు పంటలు, వ్యాధులు, మార్కెట్ ధరలు మరియు స్థిరమైన వ్యవసాయ పద్ధతులపై వ్యక్తిగతీకరించిన సలహాలను అందిస్తారు।",
-        'ta': "நீங்கள் DigiFarmer, உலகம் முழுவதும் உள்ள விவசாயிகளுக்காக பிரத்யேகமாக வடிவமைக்கப்பட்ட நிபுணத்துவ வேளாண் ஆலோசகர் AI உதவியாளர். நீங்கள் பயிர்கள், நோய்கள், சந்தை விலைகள் மற்றும் நிலையான வேளாண் நடைமுறைகள் குறித்து தனிப்பயனாக்கப்பட்ட ஆலோசனைகளை வழங்குகிறீர்கள்।"
-    }
+def parse_crop_recommendation(ai_response: str):
+    """Split an LLM crop recommendation into prose advice and its <json> block"""
+    start = ai_response.find('<json>')
+    end = ai_response.find('</json>', start)
+    if start == -1 or end == -1:
+        return ai_response, None
+    try:
+        structured = CropRecoSchema(**json.loads(ai_response[start + len('<json>'):end]))
+    except (ValueError, TypeError):
+        return ai_response, None
+    return (ai_response[:start] + ai_response[end + len('</json>'):]).strip(), structured
+
+# LLM response cache
+def load_embedder(model_name: Optional[str]):
+    """Sentence embedding function for similarity lookups, or None when no model is configured"""
+    if not model_name:
+        return None
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logging.warning("SEMANTIC_CACHE_MODEL is set but sentence-transformers is not installed; caching exact matches only")
+        return None
+    model = SentenceTransformer(model_name)
+    return lambda text: model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+class SemanticLLMCache:
+    """Cache of LLM responses, partitioned by prompt namespace.
+    
+    Lookups match the exact prompt. Only when an embedding model is supplied are
+    sufficiently similar prompts (cosine >= threshold) answered from the cache too.
+    """
+    def __init__(self, collection, threshold: float = 0.92, max_entries: int = 1000, ttl_seconds: int = 4 * 3600, embedder=None):
+        self.collection = collection
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embedder = embedder
+        self._exact: Dict[str, str] = {}
+        self._expires_at: Dict[str, float] = {}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self.stats = {'hits': 0, 'misses': 0}
+    
+    def __len__(self):
+        return len(self._exact)
+    
+    @staticmethod
+    def _key(namespace: str, prompt: str) -> str:
+        return hashlib.sha256(f"{namespace}\x00{prompt}".encode('utf-8')).hexdigest()
+    
+    def _is_fresh(self, key: str) -> bool:
+        return self._expires_at.get(key, 0.0) > time.time()
+    
+    def _remember(self, namespace: str, key: str, prompt: str, response: str, stored_at: Optional[float] = None):
+        entries = self._entries.setdefault(namespace, {'keys': [], 'vectors': [], 'responses': []})
+        self._expires_at[key] = (stored_at or time.time()) + self.ttl_seconds
+        if key in self._exact:
+            # A re-store after expiry carries a fresh answer; the key hashes the prompt, so the vector still fits
+            self._exact[key] = response
+            entries['responses'][entries['keys'].index(key)] = response
+            return
+        self._exact[key] = response
+        entries['keys'].append(key)
+        entries['responses'].append(response)
+        if self.embedder is not None:
+            entries['vectors'].append(self.embedder(prompt))
+        
+        # Keep only the most recent entries per namespace
+        overflow = len(entries['keys']) - self.max_entries
+        if overflow > 0:
+            for evicted in entries['keys'][:overflow]:
+                self._exact.pop(evicted, None)
+                self._expires_at.pop(evicted, None)
+            entries['keys'] = entries['keys'][overflow:]
+            entries['responses'] = entries['responses'][overflow:]
+            entries['vectors'] = entries['vectors'][overflow:]
+    
+    def _similar(self, namespace: str, prompt: str) -> Optional[str]:
+        entries = self._entries.get(namespace)
+        if self.embedder is None or not entries or not entries['vectors']:
+            return None
+        scores = np.stack(entries['vectors']) @ self.embedder(prompt)
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold and self._is_fresh(entries['keys'][best]):
+            return entries['responses'][best]
+        return None
     
-    system_message = language_prompts.get(language, language_prompts['en'])
+    def _oldest_fresh_ts(self) -> datetime:
+        return _utcnow() - timedelta(seconds=self.ttl_seconds)
     
+    async def warm(self):
+        """Load the most recent cached responses from the database"""
+        docs = await self.collection.find(
+            {"ts": {"$gte": self._oldest_fresh_ts()}},
+            {"_id": 0, "key": 1, "namespace": 1, "prompt": 1, "response": 1, "ts": 1}
+        ).sort("ts", -1).to_list(self.max_entries)
+        for doc in reversed(docs):
+            stored_at = doc['ts'].replace(tzinfo=timezone.utc).timestamp()
+            self._remember(doc['namespace'], doc['key'], doc['prompt'], doc['response'], stored_at)
+    
+    async def lookup(self, namespace: str, prompt: str, semantic: bool = True) -> Optional[str]:
+        """Return a cached response for an identical (or, with semantic and an embedder, a similar) prompt"""
+        key = self._key(namespace, prompt)
+        response = self._exact.get(key) if self._is_fresh(key) else None
+        
+        if response is None and semantic:
+            response = self._similar(namespace, prompt)
+        
+        if response is None:
+            # Fall back to entries written by other workers
+            doc = await self.collection.find_one(
+                {"key": key, "ts": {"$gte": self._oldest_fresh_ts()}},
+                {"_id": 0, "response": 1, "ts": 1}
+            )
+            if doc:
+                response = doc['response']
+                # Keep it in the exact tier so repeats are answered without a database round trip
+                stored_at = doc['ts'].replace(tzinfo=timezone.utc).timestamp()
+                self._remember(namespace, key, prompt, response, stored_at)
+        
+        if response is None:
+            self.stats['misses'] += 1
+        else:
+            self.stats['hits'] += 1
+        return response
+    
+    def lookup_stale(self, namespace: str, prompt: str) -> Optional[str]:
+        """Exact cached response regardless of age - a fallback while the LLM is unavailable"""
+        return self._exact.get(self._key(namespace, prompt))
+    
+    async def store(self, namespace: str, prompt: str, response: str):
+        """Cache an LLM response for later lookups"""
+        key = self._key(namespace, prompt)
+        self._remember(namespace, key, prompt, response)
+        try:
+            await self.collection.update_one(
+                {"key": key},
+                {"$set": {
+                    'key': key,
+                    'namespace': namespace,
+                    'prompt': prompt,
+                    'response': response,
+                    'ts': _utcnow()
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            logging.error("LLM cache store error: %s", e)
+
+def legacy_cache_key(**params: Any) -> str:
+    """Cache key for the legacy endpoints built from their normalised request parameters"""
+    return "|".join(f"{name}={str(value).strip().lower()}" for name, value in params.items())
+
+# Similar-prompt matching is opt-in: set SEMANTIC_CACHE_MODEL to a sentence-transformers model name
+semantic_cache = SemanticLLMCache(
+    db.llm_cache,
+    threshold=float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.92')),
+    ttl_seconds=int(os.environ.get('LLM_CACHE_TTL_HOURS', '4')) * 3600,
+    embedder=load_embedder(os.environ.get('SEMANTIC_CACHE_MODEL'))
+)
+
+# Static system prompts - kept byte-identical across calls so the provider can cache the prefix.
+# Per-request data (location, soil, weather) always goes at the end of the user message.
+SYSTEM_PROMPTS: Final[Mapping[str, str]] = MappingProxyType({
+    'en': "You are DigiFarmer, an expert agricultural advisor AI assistant specifically designed for farmers worldwide. You provide personalized advice on crops, diseases, market prices, and sustainable farming practices.",
+    'hi': "आप DigiFarmer हैं, एक विशेषज्ञ कृषि सलाहकार AI सहायक जो विशेष रूप से दुनिया भर के किसानों के लिए डिज़ाइन किया गया है। आप फसलों, बीमारियों, बाजार की कीमतों और टिकाऊ कृषि प्रथाओं पर व्यक्तिगत सलाह प्रदान करते हैं।",
+    'te': "మీరు DigiFarmer, ప్రపంచవ్యాప్తంగా రైతుల కోసం ప్రత్యేకంగా రూపొందించబడిన నిపుణ వ్యవసాయ సలహాదారు AI సహాయకుడు. మీరు పంటలు, వ్యాధులు, మార్కెట్ ధరలు మరియు స్థిరమైన వ్యవసాయ పద్ధతులపై వ్యక్తిగతీకరించిన సలహాలను అందిస్తారు।",
+    'ta': "நீங்கள் DigiFarmer, உலகம் முழுவதும் உள்ள விவசாயிகளுக்காக பிரத்யேகமாக வடிவமைக்கப்பட்ட நிபுணத்துவ வேளாண் ஆலோசகர் AI உதவியாளர். நீங்கள் பயிர்கள், நோய்கள், சந்தை விலைகள் மற்றும் நிலையான வேளாண் நடைமுறைகள் குறித்து தனிப்பயனாக்கப்பட்ட ஆலோசனைகளை வழங்குகிறீர்கள்।"
+})
+
+# Task prompt templates - the static instructions are built once; request values are filled in with %
+CROP_RECOMMENDATION_ML_PROMPT: Final[str] = """Provide detailed crop recommendations with specific variety suggestions, planting schedules, and yield expectations.
+
+Based on advanced analysis:
+Location: %s
+Soil: %s, pH: %s
+Weather: %s°C, %s%% humidity, %smm rainfall
+ML Predictions: %s"""
+
+DISEASE_TREATMENT_PROMPT: Final[str] = """Provide detailed treatment plan, prevention strategies, and follow-up recommendations.
+
+Disease detected: %s with %.1f%% confidence
+Crop type: %s"""
+
+PROFIT_ANALYSIS_ADVANCED_PROMPT: Final[str] = """Provide comprehensive profit analysis including:
+1. Expected yield based on location and weather
+2. Detailed cost breakdown with regional variations
+3. Market price predictions and risk factors
+4. ROI calculations and break-even analysis
+5. Seasonal recommendations and optimization strategies
+
+Advanced profit analysis for:
+Crop: %s
+Area: %s acres
+Location: %s
+Current market price: ₹%s/kg
+Weather: %s°C, %s%% humidity
+Investment budget: ₹%s"""
+
+CROP_RECOMMENDATION_PROMPT: Final[str] = """Recommend the best crops for cultivation under the conditions listed below.
+
+Please provide:
+1. Top 3-5 recommended crops
+2. Brief reason for each recommendation
+3. Expected yield and profit potential
+4. Best planting season
+
+Format your response as a structured recommendation.
+After the recommendation, append a JSON object between <json> and </json> tags with the keys
+"crops" (list of crop names), "reasons" (one short reason per crop) and "season" (best planting season).
+
+Location: %s
+Soil Type: %s
+pH Level: %s
+Moisture Level: %s"""
+
+PROFIT_PREDICTION_PROMPT: Final[str] = """Calculate a profit prediction for the crop listed below.
+
+Consider:
+1. Current market prices
+2. Input costs (seeds, fertilizer, labor)
+3. Expected yield per acre
+4. Seasonal price variations
+5. Transportation costs
+
+Provide a detailed profit analysis with best and worst case scenarios.
+
+Crop: %s
+Area: %s acres
+Location: %s"""
+
+# Initialize LLM Chat with multi-language support
+EMERGENT_LLM_KEY = os.environ['EMERGENT_LLM_KEY']
+
+def get_llm_chat(session_id: str, language: str = 'en'):
     return LlmChat(
-        api_key=os.environ['EMERGENT_LLM_KEY'],
+        api_key=EMERGENT_LLM_KEY,
         session_id=session_id,
-        system_message=system_message
+        system_message=SYSTEM_PROMPTS.get(language, SYSTEM_PROMPTS['en'])
     ).with_model("openai", "gpt-4o-mini")
 
+# Identical LLM requests share one upstream call while in flight; one-shot answers are also reused for a few minutes
+_inflight_llm: Dict[str, asyncio.Task] = {}
+_recent_llm_responses = TTLCache(maxsize=1024, ttl=600)
+
+async def dedup_llm_call(session_id: str, prompt: str, send, remember: bool = False) -> str:
+    """Run send() once per (session, prompt) no matter how many callers ask concurrently.
+    
+    With remember, the completed response also answers identical requests for the next ten minutes.
+    """
+    key = hashlib.sha256(f"{session_id}\x00{prompt}".encode('utf-8')).hexdigest()
+    if remember:
+        response = _recent_llm_responses.get(key)
+        if response is not None:
+            return response
+    
+    task = _inflight_llm.get(key)
+    if task is None:
+        task = asyncio.create_task(send())
+        _inflight_llm[key] = task
+        task.add_done_callback(lambda _: _inflight_llm.pop(key, None))
+    
+    # Shielded so one disconnected caller doesn't cancel the call for the others
+    response = await asyncio.shield(task)
+    if remember:
+        _recent_llm_responses[key] = response
+    return response
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the LLM while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """Fails fast for reset_timeout seconds once fail_max consecutive calls have failed"""
+    def __init__(self, fail_max: int = 5, reset_timeout: float = 60):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._half_open_in_flight = False
+    
+    @property
+    def is_open(self) -> bool:
+        if self._opened_at is None:
+            return False
+        return self._half_open_in_flight or time.monotonic() - self._opened_at < self.reset_timeout
+    
+    async def call(self, send):
+        if self.is_open:
+            raise CircuitOpenError("LLM upstream circuit is open")
+        # After reset_timeout a single trial call goes through; everyone else fails fast until it settles
+        trial = self._opened_at is not None
+        if trial:
+            self._half_open_in_flight = True
+        try:
+            result = await send()
+        except Exception:
+            # A failed trial reopens the circuit at once, since the failure count is still at fail_max
+            self._failures += 1
+            if self._failures >= self.fail_max:
+                self._opened_at = time.monotonic()
+            raise
+        finally:
+            if trial:
+                self._half_open_in_flight = False
+        self._failures = 0
+        self._opened_at = None
+        return result
+
+llm_breaker = CircuitBreaker(fail_max=5, reset_timeout=60)
+
+# Upper bound on one LLM call so a hung upstream cannot hold a worker slot
+LLM_TIMEOUT_SECONDS = float(os.environ.get('LLM_TIMEOUT_SECONDS', '25'))
+
+async def send_with_timeout(chat, user_message: UserMessage) -> str:
+    """send_message bounded by LLM_TIMEOUT_SECONDS; raises asyncio.TimeoutError when it is exceeded"""
+    try:
+        return await asyncio.wait_for(chat.send_message(user_message), timeout=LLM_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logging.error("LLM upstream timeout after %ss", LLM_TIMEOUT_SECONDS)
+        raise
+
+# Upper bound on a one-shot send including its retries and backoff
+LLM_DEADLINE_SECONDS = float(os.environ.get('LLM_DEADLINE_SECONDS', '40'))
+
+# Timeouts are not retried - another full wait would only delay the 504
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=0.5, max=4),
+    retry=retry_if_not_exception_type(asyncio.TimeoutError),
+    reraise=True
+)
+async def _send_with_retries(session_id: str, prompt: str, language: str) -> str:
+    # A fresh chat per attempt, so a failed attempt leaves no half-recorded exchange behind
+    return await send_with_timeout(get_llm_chat(session_id, language), UserMessage(text=prompt))
+
+async def send_one_shot(session_id: str, prompt: str, language: str = 'en') -> str:
+    """Send a one-shot prompt, retrying transient upstream errors with exponential backoff.
+    
+    Raises asyncio.TimeoutError once LLM_DEADLINE_SECONDS have passed, however many attempts are left.
+    """
+    try:
+        return await asyncio.wait_for(_send_with_retries(session_id, prompt, language), timeout=LLM_DEADLINE_SECONDS)
+    except asyncio.TimeoutError:
+        logging.error("LLM request gave up after %ss", LLM_DEADLINE_SECONDS)
+        raise
+
+async def ask_llm(session_id: str, prompt: str) -> str:
+    """One-shot prompt against a task-specific session"""
+    # Deliberately not pooled per tag: LlmChat keeps every exchanged message, so a shared instance would
+    # resend (and leak) other users' prompts. Building one only stores config - no connection is opened.
+    return await dedup_llm_call(
+        session_id,
+        prompt,
+        lambda: llm_breaker.call(lambda: send_one_shot(session_id, prompt)),
+        remember=True
+    )
+
+async def ask_llm_cached(namespace: str, cache_key: str, build_prompt, response: Response) -> Tuple[str, bool]:
+    """Answer from the response cache or the LLM; while the LLM circuit is open, serve a stale answer if one exists"""
+    ai_response = await semantic_cache.lookup(namespace, cache_key, semantic=False)
+    if ai_response is not None:
+        response.headers['X-Cache'] = 'HIT'
+        return ai_response, True
+    
+    try:
+        ai_response = await ask_llm(namespace, build_prompt())
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="LLM upstream timeout")
+    except CircuitOpenError:
+        ai_response = semantic_cache.lookup_stale(namespace, cache_key)
+        if ai_response is None:
+            raise HTTPException(status_code=503, detail="AI service temporarily unavailable")
+        response.headers['X-Cache'] = 'STALE'
+        return ai_response, True
+    
+    response.headers['X-Cache'] = 'MISS'
+    await semantic_cache.store(namespace, cache_key, ai_response)
+    return ai_response, False
+
+def etag_response(request: Request, payload: Any, cache_control: str = "no-cache") -> Response:
+    """JSON response with an ETag; answers 304 when the client already has this version"""
+    body = orjson.dumps(payload)
+    etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    headers = {'ETag': etag, 'Cache-Control': cache_control}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 # Routes
 @api_router.get("/")
-async def root():
-    return {"message": "DigiFarmer API - Advanced Agricultural Advisory System with ML & Real-time Data"}
+async def root(request: Request):
+    return etag_response(
+        request,
+        {"message": "DigiFarmer API - Advanced Agricultural Advisory System with ML & Real-time Data"},
+        cache_control="public, max-age=86400"
+    )
 
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
-    status_dict = input.dict()
+    status_dict = input.model_dump()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    _ = await db.status_checks.insert_one(status_obj.model_dump(exclude_none=True))
     return status_obj
 
-@api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+# Read endpoints return the stored documents as-is; they were validated on insert
+@api_router.get("/status")
+async def get_status_checks(request: Request):
+    status_checks = await db.status_checks.find({}, {"_id": 0}).sort("timestamp", -1).limit(100).to_list(100)
+    return etag_response(request, status_checks)
+
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    """LLM response cache hit/miss counters"""
+    return {
+        **semantic_cache.stats,
+        'entries': len(semantic_cache),
+        'semantic': semantic_cache.embedder is not None,
+        'threshold': semantic_cache.threshold
+    }
 
 @api_router.post("/location/analyze")
-async def analyze_location(location_data: LocationData):
+async def analyze_location(location_data: LocationData, background_tasks: BackgroundTasks):
     """Analyze location for agricultural insights"""
     try:
-        location_info = get_location_info(location_data.latitude, location_data.longitude)
-        weather_data = await get_weather_data(location_data.latitude, location_data.longitude)
+        location_info, weather_data = await asyncio.gather(
+            get_location_info(location_data.latitude, location_data.longitude),
+            get_weather_data(location_data.latitude, location_data.longitude)
+        )
         market_prices = await get_market_prices_realtime(location_info)
         
         # Store location analysis
         analysis = {
-            'id': str(uuid.uuid4()),
+            'id': fast_uuid(),
             'location': location_info,
             'weather': weather_data,
             'market_prices': market_prices,
-            'timestamp': datetime.utcnow()
+            'timestamp': _utcnow()
         }
         
-        await db.location_analyses.insert_one(analysis)
+        background_tasks.add_task(insert_document, db.location_analyses, analysis, "Location analysis")
         
         return {
             'location_info': location_info,
@@ -429,62 +1123,126 @@ async def analyze_location(location_data: LocationData):
         }
         
     except Exception as e:
-        logging.error(f"Location analysis error: {str(e)}")
+        logging.error("Location analysis error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to analyze location")
 
+def chat_cache_namespace(language: str) -> str:
+    """Cache namespace for opening chat messages, keyed by the system prompt they are answered under"""
+    system_prompt = SYSTEM_PROMPTS.get(language, SYSTEM_PROMPTS['en'])
+    return f"chat:{hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()[:16]}"
+
+async def prepare_chat_prompt(request: ChatRequest) -> Dict[str, Any]:
+    """Resolve session, language and the context-enhanced prompt for a chat request"""
+    # Generate session ID if not provided
+    session_id = request.session_id or fast_uuid()
+    
+    # Detect language if not provided
+    detected_language = request.language or detect_language(request.message)
+    
+    # Translate message to English for AI processing if needed
+    if detected_language != 'en':
+        translated_message = await translate_text(request.message, 'en', detected_language)
+    else:
+        translated_message = request.message
+    
+    # Enhance message with image and location context, appended after the question
+    context = []
+    
+    # Handle image input for disease detection
+    if request.image_data and request.message_type == "image":
+        disease_result = disease_ml.detect_disease(request.image_data)
+        context.append(f"Image analysis detected: {disease_result['disease']} with {disease_result['confidence']:.1%} confidence.")
+    
+    if request.location:
+        context.append(f"Location context: {request.location.get('address', 'Unknown location')}, {request.location.get('region', '')}, {request.location.get('country', '')}.")
+    
+    enhanced_message = translated_message
+    if context:
+        enhanced_message = f"{translated_message}\n\n{' '.join(context)}"
+    
+    return {
+        'session_id': session_id,
+        'detected_language': detected_language,
+        'enhanced_message': enhanced_message,
+        # Only an existing session can have stored history
+        'resumed_session': request.session_id is not None,
+        # Only opening text messages share cached responses: a later turn depends on the conversation so far
+        'cache_namespace': chat_cache_namespace(detected_language) if request.message_type == "text" and request.session_id is None else None
+    }
+
+async def _resolved(value):
+    return value
+
+# Earlier exchanges resent with each message of a resumed session
+CHAT_CONTEXT_TURNS = 5
+
+async def get_recent_chat_history(session_id: str, limit: int = CHAT_CONTEXT_TURNS) -> List[Dict[str, Any]]:
+    """Most recent exchanges of a session, oldest first"""
+    messages = await db.chat_messages.find(
+        {"session_id": session_id},
+        {"_id": 0, "message": 1, "response": 1}
+    ).sort("timestamp", -1).limit(limit).to_list(limit)
+    return messages[::-1]
+
+async def get_chat_ai_response(prepared: Dict[str, Any]) -> Tuple[str, bool]:
+    """Answer a prepared chat prompt from the cache or the LLM; also reports whether it was a cache hit"""
+    session_id = prepared['session_id']
+    cache_namespace = prepared['cache_namespace']
+    enhanced_message = prepared['enhanced_message']
+    
+    # Context comes from the stored history on every turn, so any worker can answer any session;
+    # fetch it concurrently with the cache lookup
+    ai_response, history = await asyncio.gather(
+        semantic_cache.lookup(cache_namespace, enhanced_message) if cache_namespace else _resolved(None),
+        get_recent_chat_history(session_id) if prepared['resumed_session'] else _resolved([])
+    )
+    
+    cache_hit = ai_response is not None
+    if not cache_hit:
+        # Earlier turns go first, in order, so the new message is always the end of the prompt
+        llm_message = enhanced_message
+        if history:
+            transcript = "\n".join(f"Farmer: {h['message']}\nDigiFarmer: {h['response']}" for h in history)
+            llm_message = f"Earlier in this conversation:\n{transcript}\n\nFarmer: {enhanced_message}"
+        
+        # Get AI response - chat answers are not reused once complete: a farmer repeating a
+        # question in a session expects a fresh answer
+        ai_response = await dedup_llm_call(
+            session_id,
+            llm_message,
+            lambda: llm_breaker.call(lambda: send_one_shot(session_id, llm_message, prepared['detected_language']))
+        )
+        if cache_namespace:
+            await semantic_cache.store(cache_namespace, enhanced_message, ai_response)
+    
+    return ai_response, cache_hit
+
 @api_router.post("/chat", response_model=ChatResponse)
-async def chat_with_ai(request: ChatRequest):
+@limiter.limit(LLM_RATE_LIMIT)
+async def chat_with_ai(request: Request, chat_request: ChatRequest, response: Response):
     try:
-        # Generate session ID if not provided
-        session_id = request.session_id or str(uuid.uuid4())
-        
-        # Detect language if not provided
-        detected_language = request.language or detect_language(request.message)
+        prepared = await prepare_chat_prompt(chat_request)
+        session_id = prepared['session_id']
+        detected_language = prepared['detected_language']
         
-        # Translate message to English for AI processing if needed
-        original_message = request.message
-        if detected_language != 'en':
-            translated_message = translate_text(request.message, 'en', detected_language)
-        else:
-            translated_message = request.message
+        ai_response, cache_hit = await get_chat_ai_response(prepared)
+        response.headers['X-Cache'] = 'HIT' if cache_hit else 'MISS'
         
-        # Initialize chat with appropriate language
-        chat = get_llm_chat(session_id, detected_language)
-        
-        # Enhance message with location context if provided
-        enhanced_message = translated_message
-        if request.location:
-            location_context = f"Location context: {request.location.get('address', 'Unknown location')}, {request.location.get('region', '')}, {request.location.get('country', '')}. "
-            enhanced_message = location_context + translated_message
-        
-        # Handle image input for disease detection
-        if request.image_data and request.message_type == "image":
-            disease_result = disease_ml.detect_disease(request.image_data)
-            image_context = f"Image analysis detected: {disease_result['disease']} with {disease_result['confidence']:.1%} confidence. "
-            enhanced_message = image_context + enhanced_message
-        
-        # Create user message
-        user_message = UserMessage(text=enhanced_message)
-        
-        # Get AI response
-        ai_response = await chat.send_message(user_message)
-        
-        # Translate response back to original language if needed
-        translated_response = None
-        if detected_language != 'en':
-            translated_response = translate_text(ai_response, detected_language, 'en')
-        
-        # Store in database
         chat_message = ChatMessage(
             session_id=session_id,
-            message=original_message,
+            message=chat_request.message,
             response=ai_response,
-            message_type=request.message_type,
+            message_type=chat_request.message_type,
             language=detected_language,
-            location=request.location
+            location=chat_request.location
         )
         
-        await db.chat_messages.insert_one(chat_message.dict())
+        # Store in database before answering, so the session's next message sees this exchange in its
+        # history; the write overlaps the translation back to the original language
+        translated_response, _ = await asyncio.gather(
+            translate_text(ai_response, detected_language, 'en') if detected_language != 'en' else _resolved(None),
+            insert_document(db.chat_messages, chat_message.model_dump(exclude_none=True), "Chat")
+        )
         
         return ChatResponse(
             response=translated_response or ai_response,
@@ -494,19 +1252,75 @@ async def chat_with_ai(request: ChatRequest):
             translated_response=translated_response
         )
         
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="LLM upstream timeout")
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="AI service temporarily unavailable")
     except Exception as e:
-        logging.error(f"Chat error: {str(e)}")
+        logging.error("Chat error: %s", e)
         raise HTTPException(status_code=500, detail=f"Chat processing failed: {str(e)}")
 
-@api_router.get("/chat/{session_id}", response_model=List[ChatMessage])
+@api_router.post("/chat/stream")
+@limiter.limit(LLM_RATE_LIMIT)
+async def chat_with_ai_stream(request: Request, chat_request: ChatRequest):
+    """Stream the AI response as Server-Sent Events"""
+    try:
+        prepared = await prepare_chat_prompt(chat_request)
+    except Exception as e:
+        logging.error("Chat stream error: %s", e)
+        raise HTTPException(status_code=500, detail=f"Chat processing failed: {str(e)}")
+    
+    session_id = prepared['session_id']
+    detected_language = prepared['detected_language']
+    
+    async def event_stream():
+        # Flush headers and session metadata before the LLM responds
+        yield f"data: {json.dumps({'session_id': session_id, 'detected_language': detected_language})}\n\n"
+        
+        try:
+            # LlmChat has no token-level streaming, so the answer arrives as a single delta
+            ai_response, _ = await get_chat_ai_response(prepared)
+            delta = await translate_text(ai_response, detected_language, 'en') if detected_language != 'en' else ai_response
+        except Exception as e:
+            logging.error("Chat stream error: %s", e)
+            yield f"event: error\ndata: {json.dumps({'detail': 'Chat processing failed'})}\n\n"
+            return
+        
+        chat_message = ChatMessage(
+            session_id=session_id,
+            message=chat_request.message,
+            response=ai_response,
+            message_type=chat_request.message_type,
+            language=detected_language,
+            location=chat_request.location
+        )
+        # Persist before yielding: a client may disconnect as soon as it has the answer, which cancels
+        # this generator at the next yield. Awaited (shielded from that cancellation) so the session's
+        # next message sees this exchange in its history.
+        await asyncio.shield(schedule_background(
+            insert_document(db.chat_messages, chat_message.model_dump(exclude_none=True), "Chat stream"),
+            "Chat stream persist"
+        ))
+        
+        yield f"data: {json.dumps({'delta': delta})}\n\n"
+        yield f"event: done\ndata: {json.dumps({'message_id': chat_message.id})}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@api_router.get("/chat/{session_id}")
 async def get_chat_history(session_id: str):
     try:
         messages = await db.chat_messages.find(
-            {"session_id": session_id}
+            {"session_id": session_id},
+            {"_id": 0}
         ).sort("timestamp", 1).to_list(100)
-        return [ChatMessage(**msg) for msg in messages]
+        return messages
     except Exception as e:
-        logging.error(f"Chat history error: {str(e)}")
+        logging.error("Chat history error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to retrieve chat history")
 
 @api_router.post("/crops/recommend-ml")
@@ -515,13 +1329,16 @@ async def recommend_crops_ml(
     longitude: float,
     soil_type: str,
     ph_level: float,
-    moisture_level: str
+    moisture_level: str,
+    background_tasks: BackgroundTasks
 ):
     """Advanced crop recommendation using ML and real-time data"""
     try:
-        # Get location and weather data
-        location_info = get_location_info(latitude, longitude)
-        weather_data = await get_weather_data(latitude, longitude)
+        # Get location and weather data concurrently
+        location_info, weather_data = await asyncio.gather(
+            get_location_info(latitude, longitude),
+            get_weather_data(latitude, longitude)
+        )
         
         # Convert moisture level to numeric
         moisture_numeric = {'Low': 30, 'Medium': 60, 'High': 80}.get(moisture_level, 50)
@@ -536,18 +1353,13 @@ async def recommend_crops_ml(
         )
         
         # Get AI recommendations
-        chat = get_llm_chat("crop_recommendation_ml")
-        
-        prompt = f"""Based on advanced analysis:
-        Location: {location_info['address']}
-        Soil: {soil_type}, pH: {ph_level}
-        Weather: {weather_data['temperature']}°C, {weather_data['humidity']}% humidity, {weather_data['rainfall']}mm rainfall
-        ML Predictions: {[pred['crop'] for pred in ml_predictions]}
-        
-        Provide detailed crop recommendations with specific variety suggestions, planting schedules, and yield expectations."""
+        prompt = CROP_RECOMMENDATION_ML_PROMPT % (
+            location_info['address'], soil_type, ph_level,
+            weather_data['temperature'], weather_data['humidity'], weather_data['rainfall'],
+            [pred['crop'] for pred in ml_predictions]
+        )
         
-        user_message = UserMessage(text=prompt)
-        ai_advice = await chat.send_message(user_message)
+        ai_advice = await ask_llm("crop_recommendation_ml", prompt)
         
         # Combine ML and AI insights
         enhanced_recommendations = []
@@ -556,7 +1368,7 @@ async def recommend_crops_ml(
                 'crop': pred['crop'],
                 'ml_confidence': pred['confidence'],
                 'suitability_score': pred['suitability_score'],
-                'expected_yield_per_acre': np.random.uniform(15, 35),  # Mock yield data
+                'expected_yield_per_acre': random.uniform(15, 35),  # Mock yield data
                 'best_varieties': f"Recommended varieties for {pred['crop']}",
                 'planting_window': "Based on current weather conditions"
             })
@@ -569,7 +1381,7 @@ async def recommend_crops_ml(
             temperature=weather_data['temperature'],
             rainfall=weather_data['rainfall'],
             recommended_crops=enhanced_recommendations,
-            confidence_score=np.mean([pred['confidence'] for pred in ml_predictions]),
+            confidence_score=sum(pred['confidence'] for pred in ml_predictions) / len(ml_predictions) if ml_predictions else 0.0,
             ml_prediction={
                 'model_used': 'RandomForestClassifier',
                 'features': ['pH', 'temperature', 'humidity', 'rainfall', 'organic_matter'],
@@ -577,7 +1389,7 @@ async def recommend_crops_ml(
             }
         )
         
-        await db.crop_recommendations.insert_one(recommendation.dict())
+        background_tasks.add_task(insert_document, db.crop_recommendations, recommendation.model_dump(exclude_none=True), "ML crop recommendation")
         
         return {
             'ml_recommendation': recommendation,
@@ -586,42 +1398,55 @@ async def recommend_crops_ml(
             'location_context': location_info
         }
         
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="LLM upstream timeout")
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="AI service temporarily unavailable")
     except Exception as e:
-        logging.error(f"ML Crop recommendation error: {str(e)}")
+        logging.error("ML Crop recommendation error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to generate crop recommendations")
 
 @api_router.post("/disease/detect")
-async def detect_disease(file: UploadFile = File(...), crop_type: str = Form(None)):
+async def detect_disease(background_tasks: BackgroundTasks, file: UploadFile = File(...), crop_type: str = Form(None)):
     """AI-powered disease detection from plant images"""
     try:
-        # Read and encode image
-        image_data = await file.read()
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
+        # Reject oversized uploads before reading them into memory
+        if file.size is not None and file.size > MAX_UPLOAD:
+            raise HTTPException(status_code=413, detail="Image too large")
+        
+        # Read image in chunks - analysed and stored as raw bytes, no base64 round-trip
+        buffer = io.BytesIO()
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            if buffer.tell() + len(chunk) > MAX_UPLOAD:
+                raise HTTPException(status_code=413, detail="Image too large")
+            buffer.write(chunk)
+        image_data = buffer.getvalue()
         
         # Perform disease detection
-        detection_result = disease_ml.detect_disease(image_base64)
+        detection_result = disease_ml.detect_disease_bytes(image_data)
         
         # Get AI treatment recommendations
-        chat = get_llm_chat("disease_detection")
-        
-        prompt = f"""Disease detected: {detection_result['disease']} with {detection_result['confidence']:.1%} confidence
-        Crop type: {crop_type or 'Unknown'}
+        prompt = DISEASE_TREATMENT_PROMPT % (detection_result['disease'], detection_result['confidence'] * 100, crop_type or 'Unknown')
         
-        Provide detailed treatment plan, prevention strategies, and follow-up recommendations."""
-        
-        user_message = UserMessage(text=prompt)
-        ai_treatment = await chat.send_message(user_message)
+        ai_treatment = await ask_llm("disease_detection", prompt)
         
         # Store detection result
+        image_id = ObjectId()
         disease_detection = DiseaseDetection(
-            image_data=image_base64,
+            image_ref=str(image_id),
             detected_disease=detection_result['disease'],
             confidence_score=detection_result['confidence'],
             treatment_recommendations=detection_result['treatments'],
             crop_type=crop_type
         )
         
-        await db.disease_detections.insert_one(disease_detection.dict())
+        background_tasks.add_task(
+            store_disease_detection,
+            image_id,
+            file.filename or disease_detection.id,
+            image_data,
+            disease_detection.model_dump(exclude_none=True)
+        )
         
         return {
             'detection_result': disease_detection,
@@ -629,8 +1454,14 @@ async def detect_disease(file: UploadFile = File(...), crop_type: str = Form(Non
             'confidence_level': 'High' if detection_result['confidence'] > 0.7 else 'Medium' if detection_result['confidence'] > 0.5 else 'Low'
         }
         
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="LLM upstream timeout")
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="AI service temporarily unavailable")
     except Exception as e:
-        logging.error(f"Disease detection error: {str(e)}")
+        logging.error("Disease detection error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to detect disease")
 
 @api_router.get("/market/prices/realtime")
@@ -641,23 +1472,22 @@ async def get_realtime_market_prices(
 ):
     """Get real-time market prices based on location"""
     try:
-        location_info = get_location_info(latitude, longitude)
+        location_info = await get_location_info(latitude, longitude)
         prices = await get_market_prices_realtime(location_info, crop)
         
         # Store prices in database
-        for price_data in prices:
-            market_price = MarketPrice(**price_data)
-            await db.market_prices.insert_one(market_price.dict())
+        if prices:
+            await bulk_upsert_prices([MarketPrice(**price_data).model_dump(exclude_none=True) for price_data in prices])
         
         return {
             'location': location_info,
             'prices': prices,
             'market_trend': 'Prices updated based on real-time data',
-            'last_updated': datetime.utcnow().isoformat()
+            'last_updated': _utcnow()
         }
         
     except Exception as e:
-        logging.error(f"Real-time market prices error: {str(e)}")
+        logging.error("Real-time market prices error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to fetch real-time market prices")
 
 @api_router.post("/market/predict-profit-advanced")
@@ -670,32 +1500,21 @@ async def predict_profit_advanced(
 ):
     """Advanced profit prediction with real-time data and ML insights"""
     try:
-        location_info = get_location_info(latitude, longitude)
-        weather_data = await get_weather_data(latitude, longitude)
+        location_info, weather_data = await asyncio.gather(
+            get_location_info(latitude, longitude),
+            get_weather_data(latitude, longitude)
+        )
         market_prices = await get_market_prices_realtime(location_info, crop_name)
         
-        # Get AI profit analysis
-        chat = get_llm_chat("profit_prediction_advanced")
-        
         current_price = market_prices[0]['price_per_kg'] if market_prices else 20.0
         
-        prompt = f"""Advanced profit analysis for:
-        Crop: {crop_name}
-        Area: {area_acres} acres
-        Location: {location_info['address']}
-        Current market price: ₹{current_price}/kg
-        Weather: {weather_data['temperature']}°C, {weather_data['humidity']}% humidity
-        Investment budget: ₹{investment_budget or 'Not specified'}
-        
-        Provide comprehensive profit analysis including:
-        1. Expected yield based on location and weather
-        2. Detailed cost breakdown with regional variations
-        3. Market price predictions and risk factors
-        4. ROI calculations and break-even analysis
-        5. Seasonal recommendations and optimization strategies"""
+        prompt = PROFIT_ANALYSIS_ADVANCED_PROMPT % (
+            crop_name, area_acres, location_info['address'], current_price,
+            weather_data['temperature'], weather_data['humidity'], investment_budget or 'Not specified'
+        )
         
-        user_message = UserMessage(text=prompt)
-        ai_analysis = await chat.send_message(user_message)
+        # Get AI profit analysis
+        ai_analysis = await ask_llm("profit_prediction_advanced", prompt)
         
         return {
             'crop': crop_name,
@@ -704,149 +1523,242 @@ async def predict_profit_advanced(
             'current_market_data': market_prices,
             'weather_impact': weather_data,
             'comprehensive_analysis': ai_analysis,
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': _utcnow(),
             'data_sources': ['real_time_weather', 'market_api', 'ml_prediction', 'ai_analysis']
         }
         
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="LLM upstream timeout")
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="AI service temporarily unavailable")
     except Exception as e:
-        logging.error(f"Advanced profit prediction error: {str(e)}")
+        logging.error("Advanced profit prediction error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to predict profit")
 
 @api_router.get("/weather/current")
-async def get_current_weather(latitude: float, longitude: float):
+async def get_current_weather(latitude: float, longitude: float, background_tasks: BackgroundTasks):
     """Get current weather data for location"""
     try:
-        location_info = get_location_info(latitude, longitude)
-        weather_data = await get_weather_data(latitude, longitude)
+        location_info, weather_data = await asyncio.gather(
+            get_location_info(latitude, longitude),
+            get_weather_data(latitude, longitude)
+        )
         
         weather_obj = WeatherData(
             location=location_info,
             **weather_data
         )
         
-        await db.weather_data.insert_one(weather_obj.dict())
+        background_tasks.add_task(insert_document, db.weather_data, weather_obj.model_dump(exclude_none=True), "Weather data")
         
         return weather_obj
         
     except Exception as e:
-        logging.error(f"Weather data error: {str(e)}")
+        logging.error("Weather data error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to fetch weather data")
 
 # Legacy endpoints for backward compatibility
 @api_router.post("/crops/recommend")
-async def recommend_crops_legacy(location: str, soil_type: str, ph_level: float, moisture_level: str):
+@limiter.limit(LLM_RATE_LIMIT)
+async def recommend_crops_legacy(request: Request, background_tasks: BackgroundTasks, response: Response, req: CropRecommendationRequest = Depends()):
     """Legacy crop recommendation endpoint"""
     try:
-        chat = get_llm_chat("crop_recommendation")
-        
-        prompt = f"""Based on the following conditions, recommend the best crops for cultivation:
-        Location: {location}
-        Soil Type: {soil_type}
-        pH Level: {ph_level}
-        Moisture Level: {moisture_level}
-        
-        Please provide:
-        1. Top 3-5 recommended crops
-        2. Brief reason for each recommendation
-        3. Expected yield and profit potential
-        4. Best planting season
-        
-        Format your response as a structured recommendation."""
-        
-        user_message = UserMessage(text=prompt)
-        ai_response = await chat.send_message(user_message)
+        # Keyed on the normalised inputs - numeric fields must match exactly, so no similarity matching
+        cache_key = legacy_cache_key(location=req.location, soil_type=req.soil_type, ph_level=round(req.ph_level, 1), moisture_level=req.moisture_level)
+        ai_response, cache_hit = await ask_llm_cached(
+            "crop_recommendation",
+            cache_key,
+            lambda: CROP_RECOMMENDATION_PROMPT % (req.location, req.soil_type, req.ph_level, req.moisture_level),
+            response
+        )
         
-        recommended_crops = ["Rice", "Wheat", "Sugarcane"]  # Placeholder
+        ai_response, structured = parse_crop_recommendation(ai_response)
+        if structured and structured.crops:
+            recommended_crops = [
+                {'crop': crop, 'confidence': 0.8, 'reason': structured.reasons[i] if i < len(structured.reasons) else ''}
+                for i, crop in enumerate(structured.crops)
+            ]
+            ml_prediction = {'model_used': 'llm_structured_output', 'season': structured.season, 'cache_hit': cache_hit}
+        else:
+            recommended_crops = [{'crop': crop, 'confidence': 0.8} for crop in ["Rice", "Wheat", "Sugarcane"]]  # Placeholder
+            ml_prediction = {'model_used': 'legacy_rules', 'cache_hit': cache_hit}
         
         recommendation = CropRecommendation(
-            location={'address': location, 'region': location, 'country': 'India'},
-            soil_type=soil_type,
-            ph_level=ph_level,
-            moisture_level=moisture_level,
+            location={'address': req.location, 'region': req.location, 'country': 'India'},
+            soil_type=req.soil_type,
+            ph_level=req.ph_level,
+            moisture_level=req.moisture_level,
             temperature=25.0,
             rainfall=300.0,
-            recommended_crops=[{'crop': crop, 'confidence': 0.8} for crop in recommended_crops],
+            recommended_crops=recommended_crops,
             confidence_score=0.85,
-            ml_prediction={'model_used': 'legacy_rules'}
+            ml_prediction=ml_prediction
         )
         
-        await db.crop_recommendations.insert_one(recommendation.dict())
+        background_tasks.add_task(insert_document, db.crop_recommendations, recommendation.model_dump(exclude_none=True), "Legacy crop recommendation")
         
         return {
             "recommendation": recommendation,
             "ai_advice": ai_response
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f"Legacy crop recommendation error: {str(e)}")
+        logging.error("Legacy crop recommendation error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to generate crop recommendations")
 
 @api_router.get("/market/prices")
-async def get_market_prices_legacy(crop: Optional[str] = None):
+async def get_market_prices_legacy(request: Request, crop: Optional[str] = None, full: bool = False):
     try:
-        query = {"crop_name": crop} if crop else {}
-        prices = await db.market_prices.find(query).sort("timestamp", -1).to_list(50)
-        return [MarketPrice(**price) for price in prices]
+        key = f"{crop or '__all__'}:{'full' if full else 'summary'}"
+        prices = _market_prices_cache.get(key)
+        if prices is None:
+            query = {"crop_name": crop} if crop else {}
+            projection = MARKET_PRICE_PROJECTION if full else MARKET_PRICE_SUMMARY_PROJECTION
+            cursor = db.market_prices.find(query, projection).sort("timestamp", -1).limit(50)
+            prices = [doc async for doc in cursor]
+            _market_prices_cache[key] = prices
+        
+        # Hashing the encoded list also catches backfilled and updated prices, not just newer ones
+        return etag_response(request, prices)
     except Exception as e:
-        logging.error(f"Market prices error: {str(e)}")
+        logging.error("Market prices error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to retrieve market prices")
 
+@api_router.post("/market/prices/bulk")
+async def bulk_insert_market_prices(prices: List[MarketPrice]):
+    """Ingest many market prices in a single write"""
+    if not prices:
+        return {'inserted': 0}
+    try:
+        result = await bulk_upsert_prices([price.model_dump(exclude_none=True) for price in prices])
+        return {'inserted': result.upserted_count, 'updated': result.modified_count}
+    except BulkWriteError as e:
+        _market_prices_cache.clear()
+        write_errors = e.details.get('writeErrors', [])
+        logging.error("Bulk market prices error: %s", write_errors[:1])
+        result = {
+            'inserted': e.details.get('nUpserted', 0),
+            'updated': e.details.get('nModified', 0),
+            'failed': [{'index': err['index'], 'error': err.get('errmsg', '')} for err in write_errors]
+        }
+        # 207 Multi-Status for a partial write, so callers checking only the status don't take it as success
+        if len(write_errors) == len(prices):
+            raise HTTPException(status_code=422, detail=result)
+        return ORJSONResponse(status_code=207, content=result)
+    except Exception as e:
+        logging.error("Bulk market prices error: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to store market prices")
+
 @api_router.post("/market/predict-profit")
-async def predict_profit_legacy(crop_name: str, area_acres: float, location: str):
+@limiter.limit(LLM_RATE_LIMIT)
+async def predict_profit_legacy(request: Request, response: Response, req: ProfitRequest = Depends()):
     try:
-        chat = get_llm_chat("profit_prediction")
-        
-        prompt = f"""Calculate profit prediction for:
-        Crop: {crop_name}
-        Area: {area_acres} acres
-        Location: {location}
-        
-        Consider:
-        1. Current market prices
-        2. Input costs (seeds, fertilizer, labor)
-        3. Expected yield per acre
-        4. Seasonal price variations
-        5. Transportation costs
-        
-        Provide a detailed profit analysis with best and worst case scenarios."""
-        
-        user_message = UserMessage(text=prompt)
-        ai_response = await chat.send_message(user_message)
+        cache_key = legacy_cache_key(crop_name=req.crop_name, area_acres=round(req.area_acres, 2), location=req.location)
+        ai_response, _ = await ask_llm_cached(
+            "profit_prediction",
+            cache_key,
+            lambda: PROFIT_PREDICTION_PROMPT % (req.crop_name, req.area_acres, req.location),
+            response
+        )
         
         return {
-            "crop": crop_name,
-            "area": area_acres,
-            "location": location,
+            "crop": req.crop_name,
+            "area": req.area_acres,
+            "location": req.location,
             "profit_analysis": ai_response,
-            "timestamp": datetime.utcnow()
+            "timestamp": _utcnow()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f"Legacy profit prediction error: {str(e)}")
+        logging.error("Legacy profit prediction error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to predict profit")
 
-# Include the router in the main app
-app.include_router(api_router)
+# Middleware is registered before the router is mounted. CORS_ORIGINS lists the browser origins
+# (comma-separated) allowed to call the API from another site; unset, cross-origin calls are refused.
+# A "*" entry opens the API to any site, so credentials are never allowed alongside it.
+# Browsers may cache a preflight for a day.
+CORS_ORIGINS = [origin.strip() for origin in os.environ.get('CORS_ORIGINS', '').split(',') if origin.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
+    allow_credentials="*" not in CORS_ORIGINS,
+    allow_origins=CORS_ORIGINS,
+    allow_methods=["GET", "POST"],
     allow_headers=["*"],
+    expose_headers=["X-Cache"],
+    max_age=86400,
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+class StreamAwareGZipMiddleware(GZipMiddleware):
+    """GZip responses except Server-Sent Events, which would sit in the compressor's buffer"""
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+app.add_middleware(StreamAwareGZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Include the router in the main app
+app.include_router(api_router)
+
+# Configure logging - one JSON object per line so log shippers don't need to regex-parse
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'logger': record.name,
+            'level': record.levelname,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(JsonLogFormatter())
+logging.basicConfig(level=logging.INFO, handlers=[_log_handler])
 logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_event():
+    # Compound indexes follow equality-sort order so list queries avoid in-memory sorts
+    indexes = [
+        (db.chat_messages, CHAT_BY_SESSION_INDEX, {}),
+        (db.market_prices, MARKET_PRICES_BY_CROP_INDEX, {}),
+        (db.market_prices, MARKET_PRICES_BY_TIME_INDEX, {}),
+        # Fails while duplicate quotes stored before bulk upserts existed remain
+        (db.market_prices, MARKET_PRICES_QUOTE_INDEX, {'unique': True}),
+        (db.status_checks, [("timestamp", -1)], {}),
+        (db.disease_detections, [("timestamp", -1)], {}),
+        (db.location_analyses, [("location.region", 1)], {}),
+        # Chat history is only read back 100 messages at a time, so expire old messages instead of
+        # using a capped collection (capped collections reject deletes and document-growing updates)
+        (db.chat_messages, [("timestamp", 1)], {'expireAfterSeconds': CHAT_HISTORY_TTL_DAYS * 24 * 3600}),
+        (db.llm_cache, [("key", 1)], {'unique': True}),
+        (db.llm_cache, [("ts", 1)], {'expireAfterSeconds': semantic_cache.ttl_seconds}),
+    ]
+    # One at a time, so an index that cannot be built (duplicates, changed TTL options) doesn't skip the rest
+    for collection, keys, options in indexes:
+        try:
+            await collection.create_index(keys, **options)
+        except Exception as e:
+            logger.error("Index creation error on %s %s: %s", collection.name, keys, e)
+    
+    try:
+        await semantic_cache.warm()
+    except Exception as e:
+        logger.error("LLM cache warm-up error: %s", e)
     logger.info("DigiFarmer Advanced API started with ML and real-time capabilities")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    # Let fire-and-forget writes finish before the Mongo client goes away
+    if _background_tasks:
+        await asyncio.wait(set(_background_tasks), timeout=10)
+    client.close()
+    await http_client.aclose()
\ No newline at end of file
@@ -4,8 +4,11 @@ DigiFarmer Backend API Testing Suite
 Tests all backend endpoints comprehensively
 """
 
-import requests
+import asyncio
+import httpx
 import json
+import re
+import sys
 import time
 import uuid
 from datetime import datetime
@@ -14,33 +17,52 @@ from typing import Dict, Any, List
 # Configuration
 BASE_URL = "https://digifarmer.preview.emergentagent.com/api"
 TIMEOUT = 30
+MAX_DETAILS_LENGTH = 512
 
-class DigiFarmerAPITester:
+class AsyncDigiFarmerAPITester:
+    # Same substring match as a keyword-by-keyword scan ("crops", "farming" count), in one pass
+    AGRI_RE = re.compile(r'crop|soil|fertilizer|season|plant|farm|agriculture', re.IGNORECASE)
+    CHAT_MESSAGE_FIELDS = frozenset({"id", "session_id", "message", "response", "timestamp"})
+    CROP_RECOMMENDATION_FIELDS = frozenset({"location", "soil_type", "ph_level", "moisture_level", "recommended_crops", "confidence_score"})
+    PROFIT_PREDICTION_FIELDS = frozenset({"crop", "area", "location", "profit_analysis", "timestamp"})
+    
     def __init__(self):
-        self.session = requests.Session()
-        self.session.timeout = TIMEOUT
+        # One HTTP/2 connection multiplexes every request, including the concurrent scenarios
+        self.client = httpx.AsyncClient(base_url=BASE_URL, http2=True, timeout=TIMEOUT)
         self.test_results = []
+        # Output is collected here and written in one go instead of a write per line
+        self._log_buffer: List[str] = []
         self.session_id = str(uuid.uuid4())
         
     def log_test(self, test_name: str, success: bool, details: str = "", response_data: Any = None):
         """Log test results"""
+        details = details[:MAX_DETAILS_LENGTH]
         result = {
             "test": test_name,
             "success": success,
             "details": details,
-            "timestamp": datetime.now().isoformat(),
-            "response_data": response_data
+            "timestamp": datetime.now().isoformat()
         }
+        # Response bodies are only worth keeping for failures
+        if not success and response_data is not None:
+            result["response_data"] = response_data
         self.test_results.append(result)
         status = "✅ PASS" if success else "❌ FAIL"
-        print(f"{status} - {test_name}: {details}")
+        self._log_buffer.append(f"{status} - {test_name}: {details}")
+    
+    def flush_log(self):
+        """Write buffered output to stdout"""
+        if self._log_buffer:
+            sys.stdout.write("\n".join(self._log_buffer) + "\n")
+            sys.stdout.flush()
+            self._log_buffer.clear()
         
-    def test_api_health(self):
+    async def test_api_health(self):
         """Test basic API connectivity and health"""
-        print("\n=== Testing API Health ===")
+        self._log_buffer.append("\n=== Testing API Health ===")
         
         try:
-            response = self.session.get(f"{BASE_URL}/")
+            response = await self.client.get("/")
             if response.status_code == 200:
                 data = response.json()
                 if "DigiFarmer API" in data.get("message", ""):
@@ -52,14 +74,14 @@ class DigiFarmerAPITester:
         except Exception as e:
             self.log_test("API Health Check", False, f"Connection error: {str(e)}")
     
-    def test_status_endpoints(self):
+    async def test_status_endpoints(self):
         """Test status check endpoints"""
-        print("\n=== Testing Status Endpoints ===")
+        self._log_buffer.append("\n=== Testing Status Endpoints ===")
         
         # Test POST /status
         try:
             status_data = {"client_name": "DigiFarmer_Test_Client"}
-            response = self.session.post(f"{BASE_URL}/status", json=status_data)
+            response = await self.client.post("/status", json=status_data)
             
             if response.status_code == 200:
                 data = response.json()
@@ -74,7 +96,7 @@ class DigiFarmerAPITester:
         
         # Test GET /status
         try:
-            response = self.session.get(f"{BASE_URL}/status")
+            response = await self.client.get("/status")
             if response.status_code == 200:
                 data = response.json()
                 if isinstance(data, list):
@@ -86,9 +108,9 @@ class DigiFarmerAPITester:
         except Exception as e:
             self.log_test("Get Status Checks", False, f"Error: {str(e)}")
     
-    def test_ai_chat_integration(self):
+    async def test_ai_chat_integration(self):
         """Test AI Chat Integration with agricultural prompts"""
-        print("\n=== Testing AI Chat Integration ===")
+        self._log_buffer.append("\n=== Testing AI Chat Integration ===")
         
         # Test agricultural question
         agricultural_questions = [
@@ -97,47 +119,46 @@ class DigiFarmerAPITester:
             "What is the best fertilizer for rice cultivation in monsoon season?"
         ]
         
-        for question in agricultural_questions:
-            try:
-                chat_data = {
-                    "message": question,
-                    "session_id": self.session_id,
-                    "message_type": "text"
-                }
-                
-                response = self.session.post(f"{BASE_URL}/chat", json=chat_data)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if "response" in data and "session_id" in data and "message_id" in data:
-                        # Check if response contains agricultural advice
-                        ai_response = data["response"].lower()
-                        agricultural_keywords = ["crop", "soil", "fertilizer", "season", "plant", "farm", "agriculture"]
-                        has_agricultural_content = any(keyword in ai_response for keyword in agricultural_keywords)
-                        
-                        if has_agricultural_content and len(data["response"]) > 50:
-                            self.log_test(f"AI Chat - {question[:30]}...", True, 
-                                        f"Got relevant agricultural advice ({len(data['response'])} chars)")
-                        else:
-                            self.log_test(f"AI Chat - {question[:30]}...", False, 
-                                        f"Response lacks agricultural content or too short: {data['response'][:100]}")
+        # Independent scenarios run concurrently
+        await asyncio.gather(*[self._check_chat_question(question) for question in agricultural_questions])
+    
+    async def _check_chat_question(self, question: str):
+        """Ask one agricultural question and check the answer"""
+        try:
+            chat_data = {
+                "message": question,
+                "session_id": self.session_id,
+                "message_type": "text"
+            }
+            
+            response = await self.client.post("/chat", json=chat_data)
+            
+            if response.status_code == 200:
+                data = response.json()
+                if "response" in data and "session_id" in data and "message_id" in data:
+                    # Check if response contains agricultural advice
+                    has_agricultural_content = bool(self.AGRI_RE.search(data["response"]))
+                    
+                    if has_agricultural_content and len(data["response"]) > 50:
+                        self.log_test(f"AI Chat - {question[:30]}...", True, 
+                                    f"Got relevant agricultural advice ({len(data['response'])} chars)")
                     else:
-                        self.log_test(f"AI Chat - {question[:30]}...", False, f"Missing fields in response: {data}")
+                        self.log_test(f"AI Chat - {question[:30]}...", False, 
+                                    f"Response lacks agricultural content or too short: {data['response'][:100]}")
                 else:
-                    self.log_test(f"AI Chat - {question[:30]}...", False, f"HTTP {response.status_code}: {response.text}")
-                    
-                # Small delay between requests
-                time.sleep(1)
-                
-            except Exception as e:
-                self.log_test(f"AI Chat - {question[:30]}...", False, f"Error: {str(e)}")
+                    self.log_test(f"AI Chat - {question[:30]}...", False, f"Missing fields in response: {data}")
+            else:
+                self.log_test(f"AI Chat - {question[:30]}...", False, f"HTTP {response.status_code}: {response.text}")
+            
+        except Exception as e:
+            self.log_test(f"AI Chat - {question[:30]}...", False, f"Error: {str(e)}")
     
-    def test_chat_history(self):
+    async def test_chat_history(self):
         """Test chat history retrieval"""
-        print("\n=== Testing Chat History ===")
+        self._log_buffer.append("\n=== Testing Chat History ===")
         
         try:
-            response = self.session.get(f"{BASE_URL}/chat/{self.session_id}")
+            response = await self.client.get(f"/chat/{self.session_id}")
             
             if response.status_code == 200:
                 data = response.json()
@@ -145,14 +166,13 @@ class DigiFarmerAPITester:
                     if len(data) > 0:
                         # Check if messages have required fields
                         first_message = data[0]
-                        required_fields = ["id", "session_id", "message", "response", "timestamp"]
-                        has_all_fields = all(field in first_message for field in required_fields)
+                        has_all_fields = self.CHAT_MESSAGE_FIELDS.issubset(first_message.keys())
                         
                         if has_all_fields:
                             self.log_test("Chat History Retrieval", True, 
                                         f"Retrieved {len(data)} messages with all required fields")
                         else:
-                            missing_fields = [field for field in required_fields if field not in first_message]
+                            missing_fields = sorted(self.CHAT_MESSAGE_FIELDS - first_message.keys())
                             self.log_test("Chat History Retrieval", False, 
                                         f"Missing fields in messages: {missing_fields}")
                     else:
@@ -164,9 +184,9 @@ class DigiFarmerAPITester:
         except Exception as e:
             self.log_test("Chat History Retrieval", False, f"Error: {str(e)}")
     
-    def test_crop_recommendation_system(self):
+    async def test_crop_recommendation_system(self):
         """Test crop recommendation with different soil/climate parameters"""
-        print("\n=== Testing Crop Recommendation System ===")
+        self._log_buffer.append("\n=== Testing Crop Recommendation System ===")
         
         test_scenarios = [
             {
@@ -189,54 +209,53 @@ class DigiFarmerAPITester:
             }
         ]
         
-        for i, scenario in enumerate(test_scenarios):
-            try:
-                response = self.session.post(f"{BASE_URL}/crops/recommend", params=scenario)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if "recommendation" in data and "ai_advice" in data:
-                        recommendation = data["recommendation"]
-                        required_fields = ["location", "soil_type", "ph_level", "moisture_level", 
-                                         "recommended_crops", "confidence_score"]
-                        
-                        has_all_fields = all(field in recommendation for field in required_fields)
-                        has_crops = len(recommendation.get("recommended_crops", [])) > 0
-                        has_advice = len(data.get("ai_advice", "")) > 100
-                        
-                        if has_all_fields and has_crops and has_advice:
-                            crops = ", ".join(recommendation["recommended_crops"])
-                            self.log_test(f"Crop Recommendation Scenario {i+1}", True, 
-                                        f"Got recommendations: {crops} (confidence: {recommendation['confidence_score']})")
-                        else:
-                            issues = []
-                            if not has_all_fields:
-                                issues.append("missing fields")
-                            if not has_crops:
-                                issues.append("no crop recommendations")
-                            if not has_advice:
-                                issues.append("insufficient AI advice")
-                            self.log_test(f"Crop Recommendation Scenario {i+1}", False, 
-                                        f"Issues: {', '.join(issues)}")
+        # Independent scenarios run concurrently
+        await asyncio.gather(*[self._check_crop_scenario(i, scenario) for i, scenario in enumerate(test_scenarios)])
+    
+    async def _check_crop_scenario(self, i: int, scenario: Dict[str, Any]):
+        """Request one crop recommendation scenario and check the result"""
+        try:
+            response = await self.client.post("/crops/recommend", params=scenario)
+            
+            if response.status_code == 200:
+                data = response.json()
+                if "recommendation" in data and "ai_advice" in data:
+                    recommendation = data["recommendation"]
+                    has_all_fields = self.CROP_RECOMMENDATION_FIELDS.issubset(recommendation.keys())
+                    has_crops = len(recommendation.get("recommended_crops", [])) > 0
+                    has_advice = len(data.get("ai_advice", "")) > 100
+                    
+                    if has_all_fields and has_crops and has_advice:
+                        crops = ", ".join(recommendation["recommended_crops"])
+                        self.log_test(f"Crop Recommendation Scenario {i+1}", True, 
+                                    f"Got recommendations: {crops} (confidence: {recommendation['confidence_score']})")
                     else:
+                        issues = []
+                        if not has_all_fields:
+                            issues.append("missing fields")
+                        if not has_crops:
+                            issues.append("no crop recommendations")
+                        if not has_advice:
+                            issues.append("insufficient AI advice")
                         self.log_test(f"Crop Recommendation Scenario {i+1}", False, 
-                                    f"Missing recommendation or ai_advice in response: {data}")
+                                    f"Issues: {', '.join(issues)}")
                 else:
                     self.log_test(f"Crop Recommendation Scenario {i+1}", False, 
-                                f"HTTP {response.status_code}: {response.text}")
-                    
-                time.sleep(1)  # Delay between requests
-                
-            except Exception as e:
-                self.log_test(f"Crop Recommendation Scenario {i+1}", False, f"Error: {str(e)}")
+                                f"Missing recommendation or ai_advice in response: {data}")
+            else:
+                self.log_test(f"Crop Recommendation Scenario {i+1}", False, 
+                            f"HTTP {response.status_code}: {response.text}")
+            
+        except Exception as e:
+            self.log_test(f"Crop Recommendation Scenario {i+1}", False, f"Error: {str(e)}")
     
-    def test_market_price_apis(self):
+    async def test_market_price_apis(self):
         """Test market price retrieval and profit prediction endpoints"""
-        print("\n=== Testing Market Price APIs ===")
+        self._log_buffer.append("\n=== Testing Market Price APIs ===")
         
         # Test GET /market/prices (all crops)
         try:
-            response = self.session.get(f"{BASE_URL}/market/prices")
+            response = await self.client.get("/market/prices")
             
             if response.status_code == 200:
                 data = response.json()
@@ -251,7 +270,7 @@ class DigiFarmerAPITester:
         
         # Test GET /market/prices with specific crop
         try:
-            response = self.session.get(f"{BASE_URL}/market/prices", params={"crop": "Rice"})
+            response = await self.client.get("/market/prices", params={"crop": "Rice"})
             
             if response.status_code == 200:
                 data = response.json()
@@ -264,9 +283,9 @@ class DigiFarmerAPITester:
         except Exception as e:
             self.log_test("Get Specific Crop Prices", False, f"Error: {str(e)}")
     
-    def test_profit_prediction(self):
+    async def test_profit_prediction(self):
         """Test profit prediction for different crops and areas"""
-        print("\n=== Testing Profit Prediction ===")
+        self._log_buffer.append("\n=== Testing Profit Prediction ===")
         
         profit_scenarios = [
             {"crop_name": "Rice", "area_acres": 5.0, "location": "Punjab, India"},
@@ -274,46 +293,46 @@ class DigiFarmerAPITester:
             {"crop_name": "Cotton", "area_acres": 3.5, "location": "Gujarat, India"}
         ]
         
-        for i, scenario in enumerate(profit_scenarios):
-            try:
-                response = self.session.post(f"{BASE_URL}/market/predict-profit", params=scenario)
+        # Independent scenarios run concurrently
+        await asyncio.gather(*[self._check_profit_scenario(scenario) for scenario in profit_scenarios])
+    
+    async def _check_profit_scenario(self, scenario: Dict[str, Any]):
+        """Request one profit prediction scenario and check the result"""
+        try:
+            response = await self.client.post("/market/predict-profit", params=scenario)
+            
+            if response.status_code == 200:
+                data = response.json()
+                has_all_fields = self.PROFIT_PREDICTION_FIELDS.issubset(data.keys())
+                has_analysis = len(data.get("profit_analysis", "")) > 100
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    required_fields = ["crop", "area", "location", "profit_analysis", "timestamp"]
-                    
-                    has_all_fields = all(field in data for field in required_fields)
-                    has_analysis = len(data.get("profit_analysis", "")) > 100
-                    
-                    if has_all_fields and has_analysis:
-                        self.log_test(f"Profit Prediction - {scenario['crop_name']}", True, 
-                                    f"Got detailed profit analysis for {scenario['area_acres']} acres")
-                    else:
-                        issues = []
-                        if not has_all_fields:
-                            missing = [f for f in required_fields if f not in data]
-                            issues.append(f"missing fields: {missing}")
-                        if not has_analysis:
-                            issues.append("insufficient profit analysis")
-                        self.log_test(f"Profit Prediction - {scenario['crop_name']}", False, 
-                                    f"Issues: {', '.join(issues)}")
+                if has_all_fields and has_analysis:
+                    self.log_test(f"Profit Prediction - {scenario['crop_name']}", True, 
+                                f"Got detailed profit analysis for {scenario['area_acres']} acres")
                 else:
+                    issues = []
+                    if not has_all_fields:
+                        missing = sorted(self.PROFIT_PREDICTION_FIELDS - data.keys())
+                        issues.append(f"missing fields: {missing}")
+                    if not has_analysis:
+                        issues.append("insufficient profit analysis")
                     self.log_test(f"Profit Prediction - {scenario['crop_name']}", False, 
-                                f"HTTP {response.status_code}: {response.text}")
-                    
-                time.sleep(1)  # Delay between requests
-                
-            except Exception as e:
-                self.log_test(f"Profit Prediction - {scenario['crop_name']}", False, f"Error: {str(e)}")
+                                f"Issues: {', '.join(issues)}")
+            else:
+                self.log_test(f"Profit Prediction - {scenario['crop_name']}", False, 
+                            f"HTTP {response.status_code}: {response.text}")
+            
+        except Exception as e:
+            self.log_test(f"Profit Prediction - {scenario['crop_name']}", False, f"Error: {str(e)}")
     
-    def test_error_handling(self):
+    async def test_error_handling(self):
         """Test API responses with invalid inputs and edge cases"""
-        print("\n=== Testing Error Handling ===")
+        self._log_buffer.append("\n=== Testing Error Handling ===")
         
         # Test invalid chat request
         try:
             invalid_chat = {"message": "", "session_id": "invalid"}
-            response = self.session.post(f"{BASE_URL}/chat", json=invalid_chat)
+            response = await self.client.post("/chat", json=invalid_chat)
             
             if response.status_code in [400, 422, 500]:
                 self.log_test("Invalid Chat Request", True, f"Properly handled invalid input with HTTP {response.status_code}")
@@ -330,7 +349,7 @@ class DigiFarmerAPITester:
                 "ph_level": -1.0,  # Invalid pH
                 "moisture_level": ""
             }
-            response = self.session.post(f"{BASE_URL}/crops/recommend", params=invalid_crop_params)
+            response = await self.client.post("/crops/recommend", params=invalid_crop_params)
             
             if response.status_code in [400, 422, 500]:
                 self.log_test("Invalid Crop Recommendation", True, f"Properly handled invalid parameters with HTTP {response.status_code}")
@@ -342,7 +361,7 @@ class DigiFarmerAPITester:
         # Test non-existent chat history
         try:
             fake_session_id = "non-existent-session-id"
-            response = self.session.get(f"{BASE_URL}/chat/{fake_session_id}")
+            response = await self.client.get(f"/chat/{fake_session_id}")
             
             if response.status_code == 200:
                 data = response.json()
@@ -355,25 +374,29 @@ class DigiFarmerAPITester:
         except Exception as e:
             self.log_test("Non-existent Chat History", False, f"Error: {str(e)}")
     
-    def run_all_tests(self):
+    async def run_all_tests(self):
         """Run all test suites"""
-        print("🚀 Starting DigiFarmer Backend API Tests")
-        print(f"Testing against: {BASE_URL}")
-        print("=" * 60)
+        self._log_buffer.append("🚀 Starting DigiFarmer Backend API Tests")
+        self._log_buffer.append(f"Testing against: {BASE_URL}")
+        self._log_buffer.append("=" * 60)
         
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         # Run all test suites
-        self.test_api_health()
-        self.test_status_endpoints()
-        self.test_ai_chat_integration()
-        self.test_chat_history()
-        self.test_crop_recommendation_system()
-        self.test_market_price_apis()
-        self.test_profit_prediction()
-        self.test_error_handling()
+        try:
+            await self.test_api_health()
+            await self.test_status_endpoints()
+            await self.test_ai_chat_integration()
+            await self.test_chat_history()
+            await self.test_crop_recommendation_system()
+            await self.test_market_price_apis()
+            await self.test_profit_prediction()
+            await self.test_error_handling()
+        finally:
+            await self.client.aclose()
+            self.flush_log()
         
-        end_time = time.time()
+        end_time = time.perf_counter()
         duration = end_time - start_time
         
         # Summary
@@ -381,20 +404,21 @@ class DigiFarmerAPITester:
         passed_tests = sum(1 for result in self.test_results if result["success"])
         failed_tests = total_tests - passed_tests
         
-        print("\n" + "=" * 60)
-        print("🏁 TEST SUMMARY")
-        print("=" * 60)
-        print(f"Total Tests: {total_tests}")
-        print(f"✅ Passed: {passed_tests}")
-        print(f"❌ Failed: {failed_tests}")
-        print(f"⏱️  Duration: {duration:.2f} seconds")
-        print(f"📊 Success Rate: {(passed_tests/total_tests)*100:.1f}%")
+        self._log_buffer.append("\n" + "=" * 60)
+        self._log_buffer.append("🏁 TEST SUMMARY")
+        self._log_buffer.append("=" * 60)
+        self._log_buffer.append(f"Total Tests: {total_tests}")
+        self._log_buffer.append(f"✅ Passed: {passed_tests}")
+        self._log_buffer.append(f"❌ Failed: {failed_tests}")
+        self._log_buffer.append(f"⏱️  Duration: {duration:.2f} seconds")
+        self._log_buffer.append(f"📊 Success Rate: {(passed_tests/total_tests)*100:.1f}%")
         
         if failed_tests > 0:
-            print("\n❌ FAILED TESTS:")
+            self._log_buffer.append("\n❌ FAILED TESTS:")
             for result in self.test_results:
                 if not result["success"]:
-                    print(f"  - {result['test']}: {result['details']}")
+                    self._log_buffer.append(f"  - {result['test']}: {result['details']}")
+        self.flush_log()
         
         return {
             "total": total_tests,
@@ -406,5 +430,5 @@ class DigiFarmerAPITester:
         }
 
 if __name__ == "__main__":
-    tester = DigiFarmerAPITester()
-    results = tester.run_all_tests()
\ No newline at end of file
+    tester = AsyncDigiFarmerAPITester()
+    results = asyncio.run(tester.run_all_tests())
\ No newline at end of file
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from server import CircuitBreaker, CircuitOpenError
+
+
+async def ok():
+    return "answer"
+
+
+async def fail():
+    raise RuntimeError("upstream error")
+
+
+def call(breaker, send):
+    return asyncio.run(breaker.call(send))
+
+
+def test_passes_results_through():
+    assert call(CircuitBreaker(), ok) == "answer"
+
+
+def test_opens_after_fail_max_consecutive_failures():
+    breaker = CircuitBreaker(fail_max=3, reset_timeout=60)
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            call(breaker, fail)
+
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        call(breaker, ok)
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(fail_max=2, reset_timeout=60)
+    with pytest.raises(RuntimeError):
+        call(breaker, fail)
+    call(breaker, ok)
+    with pytest.raises(RuntimeError):
+        call(breaker, fail)
+
+    assert not breaker.is_open
+
+
+def test_open_circuit_does_not_call_send():
+    breaker = CircuitBreaker(fail_max=1, reset_timeout=60)
+    with pytest.raises(RuntimeError):
+        call(breaker, fail)
+    calls = []
+
+    async def tracked():
+        calls.append(1)
+        return "answer"
+
+    with pytest.raises(CircuitOpenError):
+        call(breaker, tracked)
+    assert calls == []
+
+
+def test_half_open_trial_closes_on_success(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("server.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(fail_max=1, reset_timeout=60)
+    with pytest.raises(RuntimeError):
+        call(breaker, fail)
+
+    now[0] += 61
+    assert not breaker.is_open
+    assert call(breaker, ok) == "answer"
+    assert not breaker.is_open
+
+
+def test_half_open_trial_reopens_on_failure(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("server.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(fail_max=3, reset_timeout=60)
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            call(breaker, fail)
+
+    now[0] += 61
+    with pytest.raises(RuntimeError):
+        call(breaker, fail)
+    assert breaker.is_open
+
+
+def test_half_open_lets_one_concurrent_trial_through(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("server.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(fail_max=1, reset_timeout=60)
+    with pytest.raises(RuntimeError):
+        call(breaker, fail)
+    now[0] += 61
+    calls = []
+
+    async def slow_ok():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return "answer"
+
+    async def burst():
+        return await asyncio.gather(*(breaker.call(slow_ok) for _ in range(5)), return_exceptions=True)
+
+    results = asyncio.run(burst())
+
+    assert calls == [1]
+    assert results.count("answer") == 1
+    assert sum(isinstance(r, CircuitOpenError) for r in results) == 4
+    assert not breaker.is_open
+    assert call(breaker, ok) == "answer"
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from server import crop_ml
+
+
+def random_conditions(n, seed=0):
+    rng = np.random.default_rng(seed)
+    # Wider than the training ranges so samples also land outside the fitted region
+    low = np.array([3.0, 5.0, 20.0, 50.0, 0.0])
+    high = np.array([9.0, 45.0, 100.0, 700.0, 5.0])
+    return rng.uniform(low, high, size=(n, 5))
+
+
+def test_forest_is_compiled():
+    assert crop_ml._forest is not None
+
+
+@pytest.mark.parametrize("features", random_conditions(200))
+def test_compiled_forest_matches_predict_proba(features):
+    features_scaled = crop_ml.scaler.transform(features[None, :])
+
+    compiled = crop_ml._predict_proba_compiled(features_scaled)
+    expected = crop_ml.model.predict_proba(features_scaled)[0]
+
+    np.testing.assert_allclose(compiled, expected, rtol=0, atol=1e-12)
+
+
+def test_compiled_forest_matches_on_split_thresholds():
+    # Samples exactly on a split value exercise the <= comparison
+    forest = crop_ml._forest
+    internal = forest['left'] >= 0
+    for feature, threshold in list(zip(forest['feature'][internal], forest['threshold'][internal]))[:50]:
+        features_scaled = np.zeros((1, 5))
+        features_scaled[0, feature] = threshold
+
+        np.testing.assert_allclose(
+            crop_ml._predict_proba_compiled(features_scaled),
+            crop_ml.model.predict_proba(features_scaled)[0],
+            rtol=0, atol=1e-12
+        )
+
+
+def test_predict_crops_matches_sklearn_path(monkeypatch):
+    samples = random_conditions(50, seed=1).tolist()
+    compiled = [crop_ml.predict_crops(*features) for features in samples]
+
+    monkeypatch.setattr(crop_ml, '_forest', None)
+    fallback = [crop_ml.predict_crops(*features) for features in samples]
+
+    for got, expected in zip(compiled, fallback):
+        assert [r['crop'] for r in got] == [r['crop'] for r in expected]
+        assert [r['confidence'] for r in got] == pytest.approx([r['confidence'] for r in expected], abs=1e-12)
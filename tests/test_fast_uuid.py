@@ -0,0 +1,42 @@
+import threading
+import time
+import uuid
+
+from server import fast_uuid
+
+
+def test_is_rfc4122_version_7():
+    value = uuid.UUID(fast_uuid())
+
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+
+
+def test_embeds_current_unix_millis():
+    before = time.time_ns() // 1_000_000
+    value = uuid.UUID(fast_uuid())
+    after = time.time_ns() // 1_000_000
+
+    assert before <= value.int >> 80 <= after
+
+
+def test_unique_across_threads():
+    ids = []
+
+    def generate():
+        ids.extend(fast_uuid() for _ in range(10_000))
+
+    threads = [threading.Thread(target=generate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(ids)) == len(ids) == 40_000
+
+
+def test_ordered_across_milliseconds():
+    first = fast_uuid()
+    time.sleep(0.002)
+
+    assert fast_uuid() > first
@@ -0,0 +1,42 @@
+from server import parse_crop_recommendation
+
+
+def test_splits_advice_and_json_block():
+    ai_response = (
+        "Grow rice and sugarcane this kharif.\n"
+        '<json>{"crops": ["Rice", "Sugarcane"], "reasons": ["Clay soil", "High rainfall"], "season": "Kharif"}</json>\n'
+        "Irrigate weekly."
+    )
+
+    advice, structured = parse_crop_recommendation(ai_response)
+
+    assert advice == "Grow rice and sugarcane this kharif.\n\nIrrigate weekly."
+    assert structured.crops == ["Rice", "Sugarcane"]
+    assert structured.reasons == ["Clay soil", "High rainfall"]
+    assert structured.season == "Kharif"
+
+
+def test_optional_fields_default():
+    _, structured = parse_crop_recommendation('Advice <json>{"crops": ["Wheat"], "extra": 1}</json>')
+
+    assert structured.crops == ["Wheat"]
+    assert structured.reasons == []
+    assert structured.season == ""
+
+
+def test_without_json_block_returns_response_unchanged():
+    assert parse_crop_recommendation("Plant wheat.") == ("Plant wheat.", None)
+    assert parse_crop_recommendation('Plant wheat. <json>{"crops": ["Wheat"]}') == ('Plant wheat. <json>{"crops": ["Wheat"]}', None)
+
+
+def test_malformed_json_returns_response_unchanged():
+    ai_response = "Plant wheat. <json>{crops: Wheat}</json>"
+
+    assert parse_crop_recommendation(ai_response) == (ai_response, None)
+
+
+def test_schema_mismatch_returns_response_unchanged():
+    for block in ('{"season": "Rabi"}', '{"crops": "Wheat"}', '["Wheat"]'):
+        ai_response = f"Plant wheat. <json>{block}</json>"
+
+        assert parse_crop_recommendation(ai_response) == (ai_response, None)
@@ -0,0 +1,104 @@
+import asyncio
+
+import numpy as np
+
+from server import SemanticLLMCache
+
+
+class FakeCollection:
+    """In-memory stand-in for the llm_cache collection"""
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query, projection=None):
+        return None
+
+    async def update_one(self, query, update, upsert=False):
+        self.docs[query["key"]] = update["$set"]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_exact_prompt_hits():
+    cache = SemanticLLMCache(FakeCollection())
+    run(cache.store("chat:abc", "How do I treat leaf blight?", "Use a copper fungicide."))
+
+    assert run(cache.lookup("chat:abc", "How do I treat leaf blight?")) == "Use a copper fungicide."
+    assert cache.stats == {'hits': 1, 'misses': 0}
+
+
+def test_similar_prompt_misses_without_embedder():
+    cache = SemanticLLMCache(FakeCollection())
+    run(cache.store("chat:abc", "Should I irrigate wheat this week?", "Yes."))
+
+    assert run(cache.lookup("chat:abc", "Should I not irrigate wheat this week?")) is None
+    assert run(cache.lookup("chat:abc", "Should I irrigate rice this week?")) is None
+    assert cache.stats['misses'] == 2
+
+
+def test_namespaces_are_isolated():
+    cache = SemanticLLMCache(FakeCollection())
+    run(cache.store("chat:abc", "Best crop for clay soil?", "Rice."))
+
+    assert run(cache.lookup("chat:def", "Best crop for clay soil?")) is None
+
+
+def test_expired_entry_misses_but_serves_stale():
+    cache = SemanticLLMCache(FakeCollection(), ttl_seconds=0)
+    run(cache.store("crops", "key", "Wheat"))
+
+    assert run(cache.lookup("crops", "key", semantic=False)) is None
+    assert cache.lookup_stale("crops", "key") == "Wheat"
+
+
+def test_store_after_expiry_replaces_response(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("server.time.time", lambda: now[0])
+    vectors = {"irrigate wheat": np.array([1.0, 0.0], dtype=np.float32)}
+    cache = SemanticLLMCache(FakeCollection(), ttl_seconds=60, embedder=vectors.__getitem__)
+    run(cache.store("chat:abc", "irrigate wheat", "OLD"))
+
+    now[0] += 61
+    assert run(cache.lookup("chat:abc", "irrigate wheat")) is None
+    run(cache.store("chat:abc", "irrigate wheat", "NEW"))
+
+    assert run(cache.lookup("chat:abc", "irrigate wheat", semantic=False)) == "NEW"
+    assert cache._similar("chat:abc", "irrigate wheat") == "NEW"
+    assert cache.lookup_stale("chat:abc", "irrigate wheat") == "NEW"
+    assert len(cache) == 1
+
+
+def test_store_persists_without_embedding():
+    collection = FakeCollection()
+    cache = SemanticLLMCache(collection)
+    run(cache.store("crops", "key", "Wheat"))
+
+    (doc,) = collection.docs.values()
+    assert doc['response'] == "Wheat"
+    assert 'embedding' not in doc
+
+
+def test_embedder_enables_similarity_lookup():
+    vectors = {
+        "irrigate wheat": np.array([1.0, 0.0], dtype=np.float32),
+        "water wheat": np.array([0.96, 0.28], dtype=np.float32),
+        "harvest rice": np.array([0.0, 1.0], dtype=np.float32),
+    }
+    cache = SemanticLLMCache(FakeCollection(), threshold=0.9, embedder=vectors.__getitem__)
+    run(cache.store("chat:abc", "irrigate wheat", "Twice a week."))
+
+    assert run(cache.lookup("chat:abc", "water wheat")) == "Twice a week."
+    assert run(cache.lookup("chat:abc", "harvest rice")) is None
+    assert run(cache.lookup("chat:abc", "water wheat", semantic=False)) is None
+
+
+def test_max_entries_evicts_oldest():
+    cache = SemanticLLMCache(FakeCollection(), max_entries=2)
+    for i in range(3):
+        run(cache.store("crops", f"key{i}", f"answer{i}"))
+
+    assert len(cache) == 2
+    assert cache.lookup_stale("crops", "key0") is None
+    assert cache.lookup_stale("crops", "key2") == "answer2"